@@ -6,9 +6,26 @@
 """
 
 import re
-from typing import Dict, List, Tuple
+import sys
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
 from dataclasses import dataclass
 
+# Hyperscanが利用できれば長いテキストのキーワード照合に使う（未導入の環境では正規表現で照合する）
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+# Hyperscanで照合するテキストの最小文字数（短いテキストは呼び出しの手間が上回るため正規表現で照合する）
+HYPERSCAN_MIN_LENGTH = 100
+
+# キーワード照合の加算先インデックス
+_LEGAL_BUCKET = 0
+_BRAND_BUCKET = 1
+_SOCIAL_BUCKET = 2
+_CATEGORY_BUCKET_OFFSET = 3
+
 @dataclass
 class RiskScore:
     """詳細なリスクスコア"""
@@ -20,6 +37,69 @@ class RiskScore:
     category: str       # 原因カテゴリ
     confidence: float   # 分析の信頼度（0.0-1.0）
 
+class KeywordMatcher:
+    """複数キーワードの出現をテキスト1回の走査でまとめて検出する（Aho–Corasick相当）"""
+    
+    def __init__(self, keywords: Iterable[str]):
+        # キーワードはインターンしておき、照合結果と各テーブルで同じ文字列オブジェクトを共有する
+        self.keywords = tuple(dict.fromkeys(sys.intern(keyword) for keyword in keywords))
+        
+        # 同じ位置から始まるキーワードは長いものを優先して照合する
+        # （先頭文字の集合で候補位置まで読み飛ばせるよう、先読みを使わない単純な選択にする）
+        ordered = sorted(self.keywords, key=len, reverse=True)
+        alternation = '|'.join(re.escape(keyword) for keyword in ordered) or '(?!)'
+        self._pattern = re.compile(alternation)
+        
+        # 最長一致したキーワードに含まれる短いキーワードも出現済みとして扱う
+        self._contained = {
+            keyword: frozenset(other for other in self.keywords if other in keyword)
+            for keyword in self.keywords
+        }
+        
+        # Hyperscanでは全キーワードを1つのDFAにまとめ、各キーワードの最初の出現だけを通知させる
+        # （作業領域はスレッドごとに持つ）
+        self._database = None
+        if hyperscan is not None and self.keywords:
+            self._database = hyperscan.Database()
+            self._database.compile(
+                expressions=[re.escape(keyword).encode('utf-8') for keyword in self.keywords],
+                ids=list(range(len(self.keywords))),
+                elements=len(self.keywords),
+                flags=[hyperscan.HS_FLAG_SINGLEMATCH] * len(self.keywords),
+            )
+            self._local = threading.local()
+    
+    def find(self, text: str) -> Set[str]:
+        """テキスト中に出現するキーワードの集合を返す"""
+        if self._database is not None and len(text) >= HYPERSCAN_MIN_LENGTH:
+            return self._find_hyperscan(text)
+        
+        found = set()
+        search = self._pattern.search
+        position = 0
+        # 一致した開始位置の次の文字から再検索し、重なり合うキーワードも取りこぼさない
+        while True:
+            match = search(text, position)
+            if match is None:
+                return found
+            found.update(self._contained[match.group()])
+            position = match.start() + 1
+    
+    def _find_hyperscan(self, text: str) -> Set[str]:
+        """Hyperscanでテキストを1回走査し、出現するキーワードの集合を返す"""
+        scratch = getattr(self._local, 'scratch', None)
+        if scratch is None:
+            scratch = self._local.scratch = hyperscan.Scratch(self._database)
+        
+        found = set()
+        keywords = self.keywords
+        
+        def on_match(keyword_id, start, end, flags, context):
+            found.add(keywords[keyword_id])
+        
+        self._database.scan(text.encode('utf-8'), match_event_handler=on_match, scratch=scratch)
+        return found
+
 class AdvancedScoringSystem:
     """高度なスコアリングシステム"""
     
@@ -62,6 +142,20 @@ class AdvancedScoringSystem:
             }
         }
         
+        # 全段階のパターンを名前付きグループ付きの1本にまとめて初期化時にコンパイルし、
+        # 1回の走査で段階ごとの一致数を数えられるようにする
+        self._risk_pattern_re = re.compile(
+            '|'.join(
+                f'(?P<{risk_level}>' + '|'.join(f'(?:{pattern})' for pattern in config['patterns']) + ')'
+                for risk_level, config in self.risk_patterns.items()
+            ),
+            re.IGNORECASE
+        )
+        # グループ番号（定義順に1始まり）ごとの重みと基本スコア
+        self._tier_params = tuple(
+            (config['weight'], config['base_score']) for config in self.risk_patterns.values()
+        )
+        
         # 法的リスク要因
         self.legal_risk_factors = {
             '労働基準法': ['残業', '給料', '労働', '働く', '従業員'],
@@ -83,133 +177,120 @@ class AdvancedScoringSystem:
             '批判集中': ['差別', '誹謗', '中傷', '攻撃'],
             '社会問題': ['税金', '政治', '政府', '国', '社会']
         }
+        
+        # 原因カテゴリ
+        self.category_keywords = {
+            '差別的表現': ['女性', '男性', '男', '女', '性別', '結婚', '妊娠'],
+            '誹謗中傷': ['パクリ', '盗作', 'コピー', '真似', '卑劣'],
+            '個人情報漏洩': ['住所', '電話', '個人情報', '名前', 'メール'],
+            '労働問題': ['残業', '給料', '労働', '働く', '従業員'],
+            '不適切な表現': ['クソ', 'くそ', '最悪', 'ひどい', 'ダメ', 'だめ'],
+            '情報隠蔽': ['完璧', '問題ない', 'デマ', '嘘', '隠蔽'],
+            '社会的責任の欠如': ['環境', '地球', '温暖化', 'CO2', 'エコ'],
+            '社会問題への偏見': ['税金', '政治', '政府', '国', '社会'],
+            '趣味嗜好への差別': ['アニメ', 'ゲーム', '趣味', '文化', '遅れ']
+        }
+        
+        # 全キーワードを1つの照合器にまとめ、加算先と加点を行ごとの並列配列に展開する
+        # 加算先: 0=法的リスク, 1=ブランドリスク, 2=社会的リスク, 3以降=原因カテゴリ（定義順）
+        self._category_names = tuple(sys.intern(name) for name in self.category_keywords)
+        self._num_buckets = _CATEGORY_BUCKET_OFFSET + len(self._category_names)
+        
+        bucket_keywords = [
+            (_LEGAL_BUCKET, 20, self.legal_risk_factors.values()),    # 各法的リスク要因で20点追加
+            (_BRAND_BUCKET, 15, self.brand_risk_factors.values()),    # 各ブランドリスク要因で15点追加
+            (_SOCIAL_BUCKET, 10, self.social_risk_factors.values()),  # 各社会的リスク要因で10点追加
+        ]
+        for index, name in enumerate(self._category_names):
+            bucket_keywords.append((_CATEGORY_BUCKET_OFFSET + index, 1, [self.category_keywords[name]]))
+        
+        row_bucket: List[int] = []
+        row_points: List[int] = []
+        keyword_rows: Dict[str, List[int]] = {}
+        for bucket, points, keyword_lists in bucket_keywords:
+            for keywords in keyword_lists:
+                for keyword in keywords:
+                    keyword_rows.setdefault(sys.intern(keyword), []).append(len(row_bucket))
+                    row_bucket.append(bucket)
+                    row_points.append(points)
+        
+        self._row_bucket = tuple(row_bucket)
+        self._row_points = tuple(row_points)
+        self._keyword_rows = {keyword: tuple(rows) for keyword, rows in keyword_rows.items()}
+        self._keyword_matcher = KeywordMatcher(self._keyword_rows)
 
     def analyze_text(self, text: str) -> RiskScore:
         """テキストを詳細分析してリスクスコアを算出"""
         
-        # 各要素のスコアを算出
-        content_risk = self._calculate_content_risk(text)
-        legal_risk = self._calculate_legal_risk(text)
-        brand_risk = self._calculate_brand_risk(text)
-        social_risk = self._calculate_social_risk(text)
+        # テキストを1回だけ走査して各要素のスコアを算出
+        scan = self._scan(text)
         
         # 総合スコアを算出（重み付け平均）
         overall_score = self._calculate_overall_score(
-            content_risk, legal_risk, brand_risk, social_risk
+            scan['content'], scan['legal'], scan['brand'], scan['social']
         )
         
-        # 原因カテゴリを特定
-        category = self._identify_category(text)
-        
         # 信頼度を算出
-        confidence = self._calculate_confidence(text)
+        confidence = self._calculate_confidence(len(text), scan['total_matches'])
         
         return RiskScore(
             overall_score=overall_score,
-            content_risk=content_risk,
-            legal_risk=legal_risk,
-            brand_risk=brand_risk,
-            social_risk=social_risk,
-            category=category,
+            content_risk=scan['content'],
+            legal_risk=scan['legal'],
+            brand_risk=scan['brand'],
+            social_risk=scan['social'],
+            category=scan['category'],
             confidence=confidence
         )
 
-    def _calculate_content_risk(self, text: str) -> int:
-        """コンテンツリスクを算出"""
-        score = 0
-        total_matches = 0
-        
-        for risk_level, config in self.risk_patterns.items():
-            for pattern in config['patterns']:
-                matches = len(re.findall(pattern, text, re.IGNORECASE))
-                if matches > 0:
-                    score += matches * config['weight'] * config['base_score']
-                    total_matches += matches
-        
-        if total_matches == 0:
-            return 10  # デフォルト値
-        
-        return min(100, int(score / total_matches))
-
-    def _calculate_legal_risk(self, text: str) -> int:
-        """法的リスクを算出"""
-        legal_score = 0
+    def _scan(self, text: str) -> Dict:
+        """テキストを走査し、各要素のスコア・原因カテゴリ・キーワード数をまとめて算出"""
+        # コンテンツリスク（リスク段階ごとのパターン一致）
+        # 段階ごとの一致数はグループ番号で引く固定長のリストに数える（辞書を作らない）
+        tier_matches = [0] * (len(self._tier_params) + 1)
+        for match in self._risk_pattern_re.finditer(text):
+            tier_matches[match.lastindex] += 1
         
-        for law, keywords in self.legal_risk_factors.items():
-            for keyword in keywords:
-                if keyword in text:
-                    legal_score += 20  # 各法的リスク要因で20点追加
-        
-        return min(100, legal_score)
-
-    def _calculate_brand_risk(self, text: str) -> int:
-        """ブランドリスクを算出"""
-        brand_score = 0
-        
-        for risk_type, keywords in self.brand_risk_factors.items():
-            for keyword in keywords:
-                if keyword in text:
-                    brand_score += 15  # 各ブランドリスク要因で15点追加
+        content_score = 0
+        total_matches = 0
+        for group, (weight, base_score) in enumerate(self._tier_params, 1):
+            matches = tier_matches[group]
+            if matches > 0:
+                content_score += matches * weight * base_score
+                total_matches += matches
         
-        return min(100, brand_score)
-
-    def _calculate_social_risk(self, text: str) -> int:
-        """社会的リスクを算出"""
-        social_score = 0
+        # 法的・ブランド・社会的リスクと原因カテゴリ（キーワードの一括照合）
+        row_bucket = self._row_bucket
+        row_points = self._row_points
+        bucket_scores = [0] * self._num_buckets
+        for keyword in self._keyword_matcher.find(text):
+            for row in self._keyword_rows[keyword]:
+                bucket_scores[row_bucket[row]] += row_points[row]
         
-        for risk_type, keywords in self.social_risk_factors.items():
-            for keyword in keywords:
-                if keyword in text:
-                    social_score += 10  # 各社会的リスク要因で10点追加
+        # 最もスコアの高いカテゴリ（同点の場合は定義順で先のもの）
+        if self._category_names:
+            best = max(range(_CATEGORY_BUCKET_OFFSET, self._num_buckets), key=bucket_scores.__getitem__)
+            category = self._category_names[best - _CATEGORY_BUCKET_OFFSET]
+        else:
+            category = 'その他'
         
-        return min(100, social_score)
+        return {
+            'content': min(100, int(content_score / total_matches)) if total_matches else 10,  # 一致なしはデフォルト値
+            'legal': min(100, bucket_scores[_LEGAL_BUCKET]),
+            'brand': min(100, bucket_scores[_BRAND_BUCKET]),
+            'social': min(100, bucket_scores[_SOCIAL_BUCKET]),
+            'category': category,
+            'total_matches': total_matches
+        }
 
     def _calculate_overall_score(self, content: int, legal: int, brand: int, social: int) -> int:
         """総合スコアを算出（重み付け平均）"""
         # 重み付け: コンテンツ40%, 法的30%, ブランド20%, 社会的10%
-        weights = [0.4, 0.3, 0.2, 0.1]
-        scores = [content, legal, brand, social]
-        
-        weighted_score = sum(score * weight for score, weight in zip(scores, weights))
-        return int(weighted_score)
+        return int(content * 0.4 + legal * 0.3 + brand * 0.2 + social * 0.1)
 
-    def _identify_category(self, text: str) -> str:
-        """原因カテゴリを特定"""
-        category_scores = {}
-        
-        categories = {
-            '差別的表現': ['女性', '男性', '男', '女', '性別', '結婚', '妊娠'],
-            '誹謗中傷': ['パクリ', '盗作', 'コピー', '真似', '卑劣'],
-            '個人情報漏洩': ['住所', '電話', '個人情報', '名前', 'メール'],
-            '労働問題': ['残業', '給料', '労働', '働く', '従業員'],
-            '不適切な表現': ['クソ', 'くそ', '最悪', 'ひどい', 'ダメ', 'だめ'],
-            '情報隠蔽': ['完璧', '問題ない', 'デマ', '嘘', '隠蔽'],
-            '社会的責任の欠如': ['環境', '地球', '温暖化', 'CO2', 'エコ'],
-            '社会問題への偏見': ['税金', '政治', '政府', '国', '社会'],
-            '趣味嗜好への差別': ['アニメ', 'ゲーム', '趣味', '文化', '遅れ']
-        }
-        
-        for category, keywords in categories.items():
-            score = 0
-            for keyword in keywords:
-                if keyword in text:
-                    score += 1
-            category_scores[category] = score
-        
-        # 最もスコアの高いカテゴリを返す
-        if category_scores:
-            return max(category_scores, key=category_scores.get)
-        return 'その他'
-
-    def _calculate_confidence(self, text: str) -> float:
+    def _calculate_confidence(self, text_length: int, keyword_count: int) -> float:
         """分析の信頼度を算出"""
-        # テキストの長さとキーワードの多さに基づいて信頼度を算出
-        text_length = len(text)
-        keyword_count = sum(len(re.findall(pattern, text, re.IGNORECASE)) 
-                           for config in self.risk_patterns.values() 
-                           for pattern in config['patterns'])
-        
-        # 信頼度の計算（0.0-1.0）
+        # テキストの長さとキーワードの多さに基づいて信頼度を算出（0.0-1.0）
         length_factor = min(1.0, text_length / 100)  # 100文字で1.0
         keyword_factor = min(1.0, keyword_count / 5)  # 5個のキーワードで1.0
         
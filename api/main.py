@@ -8,37 +8,169 @@ import os
 import sqlite3
 import re
 import json
-from http.server import BaseHTTPRequestHandler
-from typing import List, Dict, Any
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Optional
+
+# orjsonが利用できればJSONの変換に使う（未導入の環境では標準のjsonで代替する）
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# データベースファイルのパス
+DB_PATH = "enjo_cases.db"
+
+# 接続時に設定するSQLiteのプラグマ（検索専用の接続向け。いずれも接続ごとの設定で、ファイルには記録されない）
+# ジャーナルモードはファイルに記録され、WALにすると読み取り専用のデプロイ先で開けなくなるため変更しない
+DB_PRAGMAS = (
+    "PRAGMA query_only=ON",         # 誤ってデータベースファイルを書き換えないようにする
+    "PRAGMA mmap_size=1073741824",  # 1GiBまでメモリマップで読む
+    "PRAGMA cache_size=-20000",     # ページキャッシュ約20MB
+    "PRAGMA temp_store=MEMORY",     # 並べ替え用の一時B木をメモリ上に置く
+)
+
+# 関連事例の検索で取得する列（SELECT句と同じ並び。行はタプルのまま受け取り、列名と組み合わせる）
+_RELATED_CASE_COLUMNS = ("incident_id", "title", "incident_text", "incident_date", "cause_category", "reasoning_text")
+
+# リクエストごとにhandlerが生成されるため、接続はモジュール単位で共有する
+_db_conn = None
+_db_lock = threading.Lock()
+
+# リスク判定ルール（上にあるものほど優先し、一致したうち最も優先度の高いものを採用）
+_RISK_RULES = (
+    ('fatal', r'殺害|殺す|死ね|死ぬ|殺人', 40, "極めて危険な表現"),
+    ('gender', r'女性|男性|男|女|性別', 30, "差別的表現"),
+    ('discrimination', r'差別|偏見|見下す', 30, "差別的表現"),
+    ('violence', r'暴力|暴行|殴る|蹴る', 35, "暴力的表現"),
+    ('abusive', r'クソ|くそ|最悪|ひどい', 25, "不適切な表現"),
+    ('labor', r'残業|給料|労働', 20, "労働問題"),
+    ('environment', r'環境|地球|温暖化', 15, "社会的責任"),
+    ('politics', r'税金|政治|政府', 15, "社会問題"),
+)
+
+# 全ルールを名前付きグループの1つの正規表現にまとめ、テキストを1回の走査で判定する
+_RISK_RE = re.compile(
+    '|'.join(f'(?P<{name}>{pattern})' for name, pattern, _, _ in _RISK_RULES),
+    re.IGNORECASE
+)
+
+# 一致がない場合のスコア
+_BASE_SCORE = 10
+
+# グループ名から (優先度, 最終スコア, カテゴリ) を引く表（基本スコアへの加点と0-100への丸めは読み込み時に済ませておく）
+_RISK_RULE_BY_GROUP = {
+    name: (priority, min(100, max(0, _BASE_SCORE + score_delta)), category)
+    for priority, (name, _, score_delta, category) in enumerate(_RISK_RULES)
+}
+
+# 関連事例検索のキーワードとして取り出す語（英数字・かな・漢字が2文字以上続く部分）
+_TOKEN_RE = re.compile(r'[A-Za-z0-9\u3040-\u30ff\u3400-\u9fff]{2,}')
+
+# リスク評価の表示（スコアを10で割った値で引く。70以上は高リスク、40以上は中リスク）
+_RISK_LEVELS = ("低リスク",) * 4 + ("中リスク",) * 3 + ("高リスク",) * 4
+
+# 分析結果のテキストのひな形
+_ANALYSIS_TEMPLATE = "分析結果:\n総合リスクスコア: {score}/100\n原因カテゴリ: {category}\n信頼度: {confidence}\nリスク評価: {level}\n関連事例: {count}件"
+
+def _dumps(obj: Any) -> bytes:
+    """レスポンスをUTF-8のJSONバイト列に変換する"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+def _loads(data: bytes) -> Any:
+    """リクエストボディ（UTF-8のJSON）を読み込む"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode('utf-8'))
+
+def _build_fts_query(keywords: List[str]) -> str:
+    """全文検索（FTS5）用のMATCH式を組み立てる"""
+    phrases = " OR ".join('"' + keyword.replace('"', '""') + '"' for keyword in keywords)
+    return "{title incident_text cause_category} : (" + phrases + ")"
+
+def _get_shared_connection():
+    """共有のデータベース接続を取得する（初回呼び出し時に接続する）"""
+    global _db_conn
+    with _db_lock:
+        if _db_conn is None:
+            if not os.path.exists(DB_PATH):
+                return None
+            conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+            for pragma in DB_PRAGMAS:
+                try:
+                    conn.execute(pragma)
+                except sqlite3.Error:
+                    pass  # 読み取り専用の環境では既定の設定のまま使う
+            _db_conn = conn
+        return _db_conn
 
 class handler(BaseHTTPRequestHandler):
+    # Content-Lengthを必ず付けて、同じ接続で続くリクエストを処理できるようにする（keep-alive）
+    protocol_version = "HTTP/1.1"
+    
+    def _send_cors_headers(self):
+        """CORS用のヘッダーを送信する"""
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'POST, GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+    
+    def _send_json(self, response: Dict[str, Any], allow_methods: bool = False):
+        """JSONレスポンスを送信する"""
+        body = _dumps(response)
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        if allow_methods:
+            self._send_cors_headers()
+        else:
+            self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(body)))
+        self._send_connection_header()
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _send_empty(self, status: int, cors: bool = False):
+        """本文のないレスポンスを送信する"""
+        self.send_response(status)
+        if cors:
+            self._send_cors_headers()
+        self.send_header('Content-Length', '0')
+        self._send_connection_header()
+        self.end_headers()
+    
+    def _send_connection_header(self):
+        """本文を読み切れなかった場合は、応答後に接続を閉じることを通知する"""
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+    
+    def _read_body(self) -> Optional[bytes]:
+        """リクエスト本文を読み込む（長さが分からない場合は読まずに、応答後に接続を閉じる）"""
+        # 本文を読み残すと、keep-aliveの接続では残りのバイト列が次のリクエストとして解釈されてしまう
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            content_length = -1
+        if content_length < 0 or 'Transfer-Encoding' in self.headers:
+            self.close_connection = True
+            return None
+        return self.rfile.read(content_length)
+    
     def do_GET(self):
         if self.path == '/':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
             response = {
                 "message": "炎上リスク分析API",
                 "version": "2.0.0",
                 "status": "running"
             }
-            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+            self._send_json(response)
             
         elif self.path == '/health':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
             try:
                 conn = self.get_database_connection()
                 if conn:
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT COUNT(*) FROM enjo_cases")
-                    count = cursor.fetchone()[0]
-                    conn.close()
+                    with _db_lock:
+                        count = conn.execute("SELECT COUNT(*) FROM enjo_cases").fetchone()[0]
                     
                     response = {
                         "status": "healthy",
@@ -56,24 +188,18 @@ class handler(BaseHTTPRequestHandler):
                     "error": str(e)
                 }
             
-            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+            self._send_json(response)
         else:
-            self.send_response(404)
-            self.end_headers()
+            self._send_empty(404)
     
     def do_POST(self):
+        post_data = self._read_body()
+        
         if self.path == '/analyze':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'POST, GET, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.end_headers()
-            
             try:
-                content_length = int(self.headers['Content-Length'])
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode('utf-8'))
+                if post_data is None:
+                    raise ValueError("Content-Lengthが正しく指定されていません")
+                data = _loads(post_data)
                 
                 text = data.get('text', '')
                 if not text:
@@ -82,14 +208,13 @@ class handler(BaseHTTPRequestHandler):
                     risk_score = self.calculate_risk_score(text)
                     related_cases = self.search_related_cases(text, limit=3)
                     
-                    risk_level = "高リスク" if risk_score['overall_score'] >= 70 else "中リスク" if risk_score['overall_score'] >= 40 else "低リスク"
-                    
-                    analysis_text = f"""分析結果:
-総合リスクスコア: {risk_score['overall_score']}/100
-原因カテゴリ: {risk_score['category']}
-信頼度: {risk_score['confidence']}
-リスク評価: {risk_level}
-関連事例: {len(related_cases)}件"""
+                    analysis_text = _ANALYSIS_TEMPLATE.format(
+                        score=risk_score['overall_score'],
+                        category=risk_score['category'],
+                        confidence=risk_score['confidence'],
+                        level=_RISK_LEVELS[risk_score['overall_score'] // 10],
+                        count=len(related_cases)
+                    )
                     
                     response = {
                         "input_text": text,
@@ -98,66 +223,39 @@ class handler(BaseHTTPRequestHandler):
                         "related_cases": related_cases
                     }
                 
-                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-                
             except Exception as e:
-                error_response = {"error": f"分析中にエラーが発生しました: {str(e)}"}
-                self.wfile.write(json.dumps(error_response, ensure_ascii=False).encode('utf-8'))
+                response = {"error": f"分析中にエラーが発生しました: {str(e)}"}
+            
+            self._send_json(response, allow_methods=True)
         else:
-            self.send_response(404)
-            self.end_headers()
+            self._send_empty(404)
     
     def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
+        self._send_empty(200, cors=True)
     
     def get_database_connection(self):
         """データベース接続を取得する"""
         try:
-            db_path = "enjo_cases.db"
-            if not os.path.exists(db_path):
-                return None
-            conn = sqlite3.connect(db_path)
-            conn.row_factory = sqlite3.Row
-            return conn
+            return _get_shared_connection()
         except Exception:
             return None
     
     def calculate_risk_score(self, text: str) -> Dict[str, Any]:
         """リスクスコア計算"""
-        score = 10
-        category = "その他"
+        best_rule = None
+        for match in _RISK_RE.finditer(text):
+            rule = _RISK_RULE_BY_GROUP[match.lastgroup]
+            if best_rule is None or rule[0] < best_rule[0]:
+                best_rule = rule
+                if rule[0] == 0:
+                    break  # 最優先のルールに一致したらそれ以上探さない
         
-        # 高リスクパターン
-        if re.search(r'殺害|殺す|死ね|死ぬ|殺人', text, re.IGNORECASE):
-            score += 40
-            category = "極めて危険な表現"
-        elif re.search(r'女性|男性|男|女|性別', text, re.IGNORECASE):
-            score += 30
-            category = "差別的表現"
-        elif re.search(r'差別|偏見|見下す', text, re.IGNORECASE):
-            score += 30
-            category = "差別的表現"
-        elif re.search(r'暴力|暴行|殴る|蹴る', text, re.IGNORECASE):
-            score += 35
-            category = "暴力的表現"
-        elif re.search(r'クソ|くそ|最悪|ひどい', text, re.IGNORECASE):
-            score += 25
-            category = "不適切な表現"
-        elif re.search(r'残業|給料|労働', text, re.IGNORECASE):
-            score += 20
-            category = "労働問題"
-        elif re.search(r'環境|地球|温暖化', text, re.IGNORECASE):
-            score += 15
-            category = "社会的責任"
-        elif re.search(r'税金|政治|政府', text, re.IGNORECASE):
-            score += 15
-            category = "社会問題"
+        if best_rule is not None:
+            _, score, category = best_rule
+        else:
+            score = _BASE_SCORE
+            category = "その他"
         
-        score = min(100, max(0, score))
         confidence = min(1.0, len(text) / 100)
         
         return {
@@ -173,39 +271,66 @@ class handler(BaseHTTPRequestHandler):
             return []
         
         try:
-            cursor = conn.cursor()
-            keywords = [word for word in text.split() if len(word) >= 2][:5]
+            keywords = list(dict.fromkeys(_TOKEN_RE.findall(text)))[:5]
             
-            if keywords:
-                conditions = []
-                params = []
-                for keyword in keywords:
-                    conditions.append("(title LIKE ? OR incident_text LIKE ? OR cause_category LIKE ?)")
-                    params.extend([f"%{keyword}%", f"%{keyword}%", f"%{keyword}%"])
-                
-                where_clause = " OR ".join(conditions)
-                sql = f"""
-                SELECT incident_id, title, incident_text, incident_date, cause_category, reasoning_text
-                FROM enjo_cases
-                WHERE {where_clause}
-                ORDER BY incident_date DESC
-                LIMIT ?
-                """
-                params.append(limit)
-            else:
-                sql = """
-                SELECT incident_id, title, incident_text, incident_date, cause_category, reasoning_text
-                FROM enjo_cases
-                ORDER BY incident_date DESC
-                LIMIT ?
-                """
-                params = [limit]
+            # 3文字以上のキーワードは全文検索インデックス（trigram）で、短いものはLIKEで照合する
+            fts_keywords = [keyword for keyword in keywords if len(keyword) >= 3]
+            like_keywords = [keyword for keyword in keywords if len(keyword) < 3]
             
-            cursor.execute(sql, params)
-            results = cursor.fetchall()
-            return [dict(row) for row in results]
+            try:
+                return self._query_related_cases(conn, fts_keywords, like_keywords, limit)
+            except sqlite3.OperationalError:
+                # 全文検索インデックスが未作成の場合はすべてLIKE検索で代替する
+                return self._query_related_cases(conn, [], keywords, limit)
             
         except Exception:
             return []
-        finally:
-            conn.close()
\ No newline at end of file
+    
+    def _query_related_cases(self, conn: sqlite3.Connection, fts_keywords: List[str], like_keywords: List[str],
+                             limit: int) -> List[Dict[str, Any]]:
+        """キーワードのいずれかを含む事例を新しい順に取得する"""
+        conditions = []
+        params = []
+        
+        if fts_keywords:
+            conditions.append("incident_id IN (SELECT rowid FROM enjo_fts WHERE enjo_fts MATCH ?)")
+            params.append(_build_fts_query(fts_keywords))
+        
+        for keyword in like_keywords:
+            conditions.append("(title LIKE ? OR incident_text LIKE ? OR cause_category LIKE ?)")
+            params.extend([f"%{keyword}%", f"%{keyword}%", f"%{keyword}%"])
+        
+        if conditions:
+            where_clause = " OR ".join(conditions)
+            sql = f"""
+            SELECT incident_id, title, incident_text, incident_date, cause_category, reasoning_text
+            FROM enjo_cases
+            WHERE {where_clause}
+            ORDER BY incident_date DESC
+            LIMIT ?
+            """
+            params.append(limit)
+        else:
+            sql = """
+            SELECT incident_id, title, incident_text, incident_date, cause_category, reasoning_text
+            FROM enjo_cases
+            ORDER BY incident_date DESC
+            LIMIT ?
+            """
+            params = [limit]
+        
+        with _db_lock:
+            results = conn.execute(sql, params).fetchall()
+        return [dict(zip(_RELATED_CASE_COLUMNS, row)) for row in results]
+
+# ローカル実行用（Vercel上ではhandlerクラスのみが使われる）
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", "8000"))
+    server = ThreadingHTTPServer(("0.0.0.0", port), handler)
+    print(f"炎上リスク分析APIを起動しました: http://localhost:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -11,74 +11,147 @@ import os
 from datetime import datetime
 from typing import Dict, List, Optional
 
+from advanced_scoring import KeywordMatcher
+
+# パターン抽出に使う表現（種類ごとに、出力する順序で並べる）
+_DANGEROUS_WORDS = ('クソ', 'くそ', '最悪', 'ひどい', 'ダメ', 'だめ', 'やばい')
+_DISCRIMINATORY_WORDS = ('女性', '男性', '男', '女', '性別')
+_EMOTION_WORDS = ('怒', '悲', '喜', '驚', '恐', '嫌')
+
+# (パターン名, 表現) を出力順に並べた一覧と、全表現を1回の走査で検出するマッチャー
+_PATTERN_NAMES = tuple(
+    (f"{kind}_{word}", word)
+    for kind, words in (
+        ('dangerous', _DANGEROUS_WORDS),
+        ('discriminatory', _DISCRIMINATORY_WORDS),
+        ('emotion', _EMOTION_WORDS),
+    )
+    for word in words
+)
+_PATTERN_MATCHER = KeywordMatcher(word for _, word in _PATTERN_NAMES)
+
 class FeedbackLearningSystem:
     """フィードバック学習システム"""
     
-    def __init__(self, db_path: str = "enjo_cases.db"):
+    # 事例データベース（enjo_cases.db）はセットアップ時に作り直されるため、フィードバックは別のファイルに保存する
+    def __init__(self, db_path: str = "feedback.db"):
         self.db_path = db_path
         self.feedback_file = "feedback_data.json"
-        self.learning_data = self._load_feedback_data()
+        self.conn = sqlite3.connect(db_path)
+        self._create_tables()
+        self._migrate_feedback_file()
+        
+        # 精度計算用の件数と誤差合計は起動時に一度だけ集計し、以降は差分で更新する
+        self._feedback_count, self._sum_difference = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(score_difference), 0) FROM corrections"
+        ).fetchone()
     
-    def _load_feedback_data(self) -> Dict:
-        """フィードバックデータを読み込み"""
-        if os.path.exists(self.feedback_file):
-            with open(self.feedback_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {
-            'feedback_count': 0,
-            'accuracy_history': [],
-            'user_corrections': [],
-            'pattern_weights': {}
-        }
+    def close(self):
+        """データベース接続を閉じる（最後の接続を閉じるときにWALの内容がデータベースファイルに書き戻される）"""
+        self.conn.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
-    def _save_feedback_data(self):
-        """フィードバックデータを保存"""
-        with open(self.feedback_file, 'w', encoding='utf-8') as f:
-            json.dump(self.learning_data, f, ensure_ascii=False, indent=2)
+    def _create_tables(self):
+        """フィードバック用のテーブルを作成"""
+        try:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.Error:
+            pass  # WALに切り替えられない環境では既定のジャーナルのまま使う
+        self.conn.executescript("""
+        CREATE TABLE IF NOT EXISTS corrections (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            text TEXT NOT NULL,
+            predicted_score INTEGER NOT NULL,
+            user_score INTEGER NOT NULL,
+            user_comment TEXT,
+            score_difference INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS accuracy_history (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            accuracy REAL NOT NULL,
+            feedback_count INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS pattern_weights (
+            pattern TEXT PRIMARY KEY,
+            weight REAL NOT NULL
+        );
+        """)
+    
+    def _migrate_feedback_file(self):
+        """旧形式のフィードバックデータ（JSON）があれば一度だけ取り込む"""
+        if not os.path.exists(self.feedback_file):
+            return
+        if self.conn.execute("SELECT 1 FROM corrections LIMIT 1").fetchone():
+            return
+        
+        with open(self.feedback_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        
+        with self.conn:
+            self.conn.executemany(
+                """INSERT INTO corrections
+                   (timestamp, text, predicted_score, user_score, user_comment, score_difference)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                [(c['timestamp'], c['text'], c['predicted_score'], c['user_score'],
+                  c.get('user_comment', ''), c['score_difference'])
+                 for c in data.get('user_corrections', [])]
+            )
+            self.conn.executemany(
+                "INSERT INTO accuracy_history (timestamp, accuracy, feedback_count) VALUES (?, ?, ?)",
+                [(h['timestamp'], h['accuracy'], h['feedback_count'])
+                 for h in data.get('accuracy_history', [])]
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO pattern_weights (pattern, weight) VALUES (?, ?)",
+                data.get('pattern_weights', {}).items()
+            )
     
     def add_feedback(self, text: str, predicted_score: int, user_score: int, 
                     user_comment: str = "") -> bool:
         """ユーザーフィードバックを追加"""
         
-        feedback = {
-            'timestamp': datetime.now().isoformat(),
-            'text': text,
-            'predicted_score': predicted_score,
-            'user_score': user_score,
-            'user_comment': user_comment,
-            'score_difference': abs(predicted_score - user_score)
-        }
-        
-        self.learning_data['user_corrections'].append(feedback)
-        self.learning_data['feedback_count'] += 1
-        
-        # 精度を計算
-        accuracy = self._calculate_accuracy()
-        self.learning_data['accuracy_history'].append({
-            'timestamp': datetime.now().isoformat(),
-            'accuracy': accuracy,
-            'feedback_count': self.learning_data['feedback_count']
-        })
+        score_difference = abs(predicted_score - user_score)
+        timestamp = datetime.now().isoformat()
         
-        # パターンの重みを更新
-        self._update_pattern_weights(text, predicted_score, user_score)
-        
-        self._save_feedback_data()
+        # 1件ごとに追記のみ行い、全データの書き直しはしない
+        with self.conn:
+            self.conn.execute(
+                """INSERT INTO corrections
+                   (timestamp, text, predicted_score, user_score, user_comment, score_difference)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (timestamp, text, predicted_score, user_score,
+                 user_comment, score_difference)
+            )
+            self._feedback_count += 1
+            self._sum_difference += score_difference
+            
+            # 精度を計算
+            accuracy = self._calculate_accuracy()
+            self.conn.execute(
+                "INSERT INTO accuracy_history (timestamp, accuracy, feedback_count) VALUES (?, ?, ?)",
+                (timestamp, accuracy, self._feedback_count)
+            )
+            
+            # パターンの重みを更新
+            self._update_pattern_weights(text, predicted_score, user_score)
         
         print(f"フィードバックを記録しました（精度: {accuracy:.1f}%）")
         return True
     
     def _calculate_accuracy(self) -> float:
         """現在の精度を計算"""
-        if not self.learning_data['user_corrections']:
+        if not self._feedback_count:
             return 0.0
         
-        total_difference = sum(feedback['score_difference'] 
-                             for feedback in self.learning_data['user_corrections'])
-        total_feedback = len(self.learning_data['user_corrections'])
-        
         # 平均誤差を計算（0-100スケール）
-        average_error = total_difference / total_feedback
+        average_error = self._sum_difference / self._feedback_count
         accuracy = max(0, 100 - average_error)
         
         return accuracy
@@ -88,50 +161,37 @@ class FeedbackLearningSystem:
         # 簡単なパターン抽出
         patterns = self._extract_patterns(text)
         
-        for pattern in patterns:
-            if pattern not in self.learning_data['pattern_weights']:
-                self.learning_data['pattern_weights'][pattern] = 1.0
-            
-            # 重みを調整
-            score_diff = user_score - predicted_score
-            if score_diff > 0:  # ユーザーの方が高いスコア
-                self.learning_data['pattern_weights'][pattern] *= 1.1
-            elif score_diff < 0:  # ユーザーの方が低いスコア
-                self.learning_data['pattern_weights'][pattern] *= 0.9
-            
-            # 重みの範囲を制限
-            self.learning_data['pattern_weights'][pattern] = max(0.1, 
-                min(3.0, self.learning_data['pattern_weights'][pattern]))
+        # 重みの調整率はフィードバック1件につき一度だけ決める
+        score_diff = user_score - predicted_score
+        if score_diff > 0:  # ユーザーの方が高いスコア
+            factor = 1.1
+        elif score_diff < 0:  # ユーザーの方が低いスコア
+            factor = 0.9
+        else:
+            factor = 1.0
+        
+        # 重みを調整し、範囲を制限（未登録のパターンは1.0から始める）
+        self.conn.executemany(
+            """INSERT INTO pattern_weights (pattern, weight)
+               VALUES (?, max(0.1, min(3.0, ?)))
+               ON CONFLICT(pattern) DO UPDATE SET weight = max(0.1, min(3.0, weight * excluded.weight))""",
+            [(pattern, factor) for pattern in patterns]
+        )
     
     def _extract_patterns(self, text: str) -> List[str]:
         """テキストからパターンを抽出"""
-        import re
-        
-        patterns = []
-        
-        # 危険な表現のパターン
-        dangerous_words = ['クソ', 'くそ', '最悪', 'ひどい', 'ダメ', 'だめ', 'やばい']
-        for word in dangerous_words:
-            if word in text:
-                patterns.append(f"dangerous_{word}")
+        found = _PATTERN_MATCHER.find(text)
+        if not found:
+            return []
         
-        # 差別的表現のパターン
-        discriminatory_words = ['女性', '男性', '男', '女', '性別']
-        for word in discriminatory_words:
-            if word in text:
-                patterns.append(f"discriminatory_{word}")
-        
-        # 感情表現のパターン
-        emotion_words = ['怒', '悲', '喜', '驚', '恐', '嫌']
-        for word in emotion_words:
-            if word in text:
-                patterns.append(f"emotion_{word}")
+        patterns = [name for name, word in _PATTERN_NAMES if word in found]
         
         return patterns
     
     def get_learning_statistics(self) -> Dict:
         """学習統計を取得"""
-        if not self.learning_data['user_corrections']:
+        total_feedback = self._feedback_count
+        if not total_feedback:
             return {
                 'total_feedback': 0,
                 'current_accuracy': 0.0,
@@ -140,21 +200,24 @@ class FeedbackLearningSystem:
             }
         
         # 精度の改善傾向を計算
-        accuracy_history = self.learning_data['accuracy_history']
-        if len(accuracy_history) >= 2:
-            recent_accuracy = accuracy_history[-1]['accuracy']
-            older_accuracy = accuracy_history[0]['accuracy']
+        history_count, older_accuracy = self.conn.execute(
+            "SELECT COUNT(*), (SELECT accuracy FROM accuracy_history ORDER BY id LIMIT 1) FROM accuracy_history"
+        ).fetchone()
+        if history_count >= 2:
+            recent_accuracy = self.conn.execute(
+                "SELECT accuracy FROM accuracy_history ORDER BY id DESC LIMIT 1"
+            ).fetchone()[0]
             improvement = recent_accuracy - older_accuracy
         else:
             improvement = 0.0
         
-        # 重要なパターンを取得
-        pattern_weights = self.learning_data['pattern_weights']
-        sorted_patterns = sorted(pattern_weights.items(), key=lambda x: x[1], reverse=True)
-        top_patterns = sorted_patterns[:10]
+        # 重要なパターンを取得（同じ重みは登録順）
+        top_patterns = [tuple(row) for row in self.conn.execute(
+            "SELECT pattern, weight FROM pattern_weights ORDER BY weight DESC, rowid LIMIT 10"
+        )]
         
         return {
-            'total_feedback': self.learning_data['feedback_count'],
+            'total_feedback': total_feedback,
             'current_accuracy': self._calculate_accuracy(),
             'improvement_trend': improvement,
             'top_patterns': top_patterns
@@ -186,26 +249,26 @@ class FeedbackLearningSystem:
 
 # 使用例
 if __name__ == "__main__":
-    feedback_system = FeedbackLearningSystem()
-    
-    # フィードバックを追加
-    feedback_system.add_feedback(
-        text="弊社の新商品は本当にクソみたいな仕上がりでした",
-        predicted_score=85,
-        user_score=90,
-        user_comment="もう少し高いスコアが適切だと思います"
-    )
-    
-    # 統計を表示
-    stats = feedback_system.get_learning_statistics()
-    print("学習統計:")
-    print(f"総フィードバック数: {stats['total_feedback']}")
-    print(f"現在の精度: {stats['current_accuracy']:.1f}%")
-    print(f"改善傾向: {stats['improvement_trend']:.1f}%")
-    
-    # 推奨事項を表示
-    recommendations = feedback_system.get_recommendations()
-    print("\n推奨事項:")
-    for rec in recommendations:
-        print(f"- {rec}")
+    with FeedbackLearningSystem() as feedback_system:
+        
+        # フィードバックを追加
+        feedback_system.add_feedback(
+            text="弊社の新商品は本当にクソみたいな仕上がりでした",
+            predicted_score=85,
+            user_score=90,
+            user_comment="もう少し高いスコアが適切だと思います"
+        )
+        
+        # 統計を表示
+        stats = feedback_system.get_learning_statistics()
+        print("学習統計:")
+        print(f"総フィードバック数: {stats['total_feedback']}")
+        print(f"現在の精度: {stats['current_accuracy']:.1f}%")
+        print(f"改善傾向: {stats['improvement_trend']:.1f}%")
+        
+        # 推奨事項を表示
+        recommendations = feedback_system.get_recommendations()
+        print("\n推奨事項:")
+        for rec in recommendations:
+            print(f"- {rec}")
 
@@ -8,7 +8,137 @@ CSVファイルから炎上事例データをインポートするスクリプ
 import csv
 import sqlite3
 import os
+from contextlib import nullcontext
 from datetime import datetime
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool
+
+# 進捗を表示する間隔（行数）
+PROGRESS_INTERVAL = 1000
+
+# このサイズ以上のCSVは、行の整形を複数プロセスで並列に行う（小さいファイルでは起動コストの方が大きい）
+PARALLEL_THRESHOLD_BYTES = 50 * 1024 * 1024
+
+# 整形処理に渡す1回あたりの行数
+CHUNK_ROWS = 1000
+
+# 関連事例検索でカテゴリの重要度順に並べるための優先度（一覧にないカテゴリは1）
+CATEGORY_PRIORITY = {
+    '差別的表現': 5,
+    '誹謗中傷': 5,
+    '個人情報漏洩': 5,
+    '労働問題': 4,
+    '社会的責任の欠如': 4,
+    '情報隠蔽': 4,
+    '不適切な表現': 3,
+    '不謹慎な表現': 3,
+    '社会問題への偏見': 3,
+    '趣味嗜好への差別': 2,
+}
+DEFAULT_CATEGORY_PRIORITY = 1
+
+REQUIRED_COLUMNS = ['title', 'incident_text', 'incident_date', 'cause_category', 'reasoning_text']
+OPTIONAL_COLUMNS = ['company_info', 'media_url', 'response_text', 'outcome']
+
+def _iter_chunks(reader, size: int):
+    """CSVの行を size 行ずつのリストにまとめて返す"""
+    while True:
+        chunk = list(islice(reader, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _normalize_rows(rows, positions):
+    """CSVの行を挿入用のタプルに変換する（並列処理時はワーカープロセスで実行される）"""
+    (title_i, text_i, date_i, category_i, reasoning_i,
+     company_i, media_i, response_i, outcome_i) = positions
+    return [
+        (
+            row[title_i].strip(),
+            row[text_i].strip(),
+            row[date_i].strip(),
+            row[category_i].strip(),
+            row[reasoning_i].strip(),
+            (row[company_i].strip() or None) if company_i is not None else None,
+            (row[media_i].strip() or None) if media_i is not None else None,
+            (row[response_i].strip() or None) if response_i is not None else None,
+            (row[outcome_i].strip() or None) if outcome_i is not None else None
+        )
+        for row in rows
+        if row  # 空行は読み飛ばす
+    ]
+
+def create_search_index(cursor):
+    """関連事例検索用の全文検索インデックス（FTS5）を作成する"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'enjo_fts'")
+    if cursor.fetchone():
+        return
+    
+    # 日本語は空白で区切られないため、部分一致に使えるtrigramトークナイザを使う
+    cursor.executescript("""
+    CREATE VIRTUAL TABLE enjo_fts USING fts5(
+        title, incident_text, cause_category, reasoning_text,
+        content='enjo_cases', content_rowid='incident_id', tokenize='trigram'
+    );
+    
+    CREATE TRIGGER IF NOT EXISTS enjo_fts_insert AFTER INSERT ON enjo_cases BEGIN
+        INSERT INTO enjo_fts(rowid, title, incident_text, cause_category, reasoning_text)
+        VALUES (new.incident_id, new.title, new.incident_text, new.cause_category, new.reasoning_text);
+    END;
+    
+    CREATE TRIGGER IF NOT EXISTS enjo_fts_delete AFTER DELETE ON enjo_cases BEGIN
+        INSERT INTO enjo_fts(enjo_fts, rowid, title, incident_text, cause_category, reasoning_text)
+        VALUES ('delete', old.incident_id, old.title, old.incident_text, old.cause_category, old.reasoning_text);
+    END;
+    
+    CREATE TRIGGER IF NOT EXISTS enjo_fts_update AFTER UPDATE ON enjo_cases BEGIN
+        INSERT INTO enjo_fts(enjo_fts, rowid, title, incident_text, cause_category, reasoning_text)
+        VALUES ('delete', old.incident_id, old.title, old.incident_text, old.cause_category, old.reasoning_text);
+        INSERT INTO enjo_fts(rowid, title, incident_text, cause_category, reasoning_text)
+        VALUES (new.incident_id, new.title, new.incident_text, new.cause_category, new.reasoning_text);
+    END;
+    
+    INSERT INTO enjo_fts(enjo_fts) VALUES ('rebuild');
+    """)
+    print("全文検索インデックス（enjo_fts）を作成しました")
+
+def category_priority_sql(column: str = "cause_category") -> str:
+    """カテゴリの優先度を求めるSQLのCASE式を返す"""
+    whens = " ".join(
+        "WHEN '{}' THEN {}".format(category.replace("'", "''"), priority)
+        for category, priority in CATEGORY_PRIORITY.items()
+    )
+    return f"CASE {column} {whens} ELSE {DEFAULT_CATEGORY_PRIORITY} END"
+
+def create_category_priority(cursor):
+    """カテゴリの優先度列（生成列）と、優先度・日付順の並べ替え用インデックスを作成する"""
+    priority_sql = category_priority_sql()
+    cursor.execute("PRAGMA table_xinfo(enjo_cases)")
+    exists = any(column[1] == 'category_priority' for column in cursor.fetchall())
+    if exists:
+        # 生成式は列の作成時に固定されるため、CATEGORY_PRIORITY が変わっていたら列を作り直す
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'enjo_cases'")
+        if priority_sql not in cursor.fetchone()[0]:
+            cursor.execute("DROP INDEX IF EXISTS idx_priority_date")
+            cursor.execute("ALTER TABLE enjo_cases DROP COLUMN category_priority")
+            print("カテゴリ優先度の対応表が変わったため、列（category_priority）を作り直します")
+            exists = False
+    if not exists:
+        # cause_category から自動的に求まる列にして、どの挿入経路でも値がずれないようにする
+        cursor.execute(
+            "ALTER TABLE enjo_cases ADD COLUMN category_priority INTEGER "
+            f"GENERATED ALWAYS AS ({priority_sql}) VIRTUAL"
+        )
+        print("カテゴリ優先度の列（category_priority）を追加しました")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_priority_date ON enjo_cases(category_priority DESC, incident_date DESC)"
+    )
+
+def create_date_index(cursor):
+    """関連事例検索の ORDER BY incident_date DESC LIMIT 用のインデックスを作成する"""
+    # 日付順にインデックスをたどり、LIMIT件見つかった時点で検索を打ち切れるようにする
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_incident_date ON enjo_cases(incident_date)")
 
 def import_csv_to_database(csv_file_path: str, db_path: str = "enjo_cases.db"):
     """CSVファイルからデータベースにデータをインポートする"""
@@ -22,56 +152,61 @@ def import_csv_to_database(csv_file_path: str, db_path: str = "enjo_cases.db"):
     cursor = conn.cursor()
     
     try:
+        # 既存データを含めて検索インデックスを用意し、以降の挿入はトリガーで同期する
+        create_search_index(cursor)
+        create_category_priority(cursor)
+        
         with open(csv_file_path, 'r', encoding='utf-8') as csvfile:
-            # CSVファイルの読み込み
-            reader = csv.DictReader(csvfile)
+            # CSVファイルの読み込み（行ごとのdictは作らず、ヘッダーから列位置を引いておく）
+            reader = csv.reader(csvfile)
+            fieldnames = next(reader, [])
+            column_index = {name: i for i, name in enumerate(fieldnames)}
             
             # 必要なカラムをチェック
-            required_columns = ['title', 'incident_text', 'incident_date', 'cause_category', 'reasoning_text']
-            if not all(col in reader.fieldnames for col in required_columns):
+            if not all(col in column_index for col in REQUIRED_COLUMNS):
                 print(f"エラー: 必要なカラムが不足しています。")
-                print(f"必要なカラム: {required_columns}")
-                print(f"実際のカラム: {reader.fieldnames}")
+                print(f"必要なカラム: {REQUIRED_COLUMNS}")
+                print(f"実際のカラム: {fieldnames}")
                 return False
             
+            # 任意のカラムは存在しない場合 None
+            positions = tuple(column_index[col] for col in REQUIRED_COLUMNS) + tuple(
+                column_index.get(col) for col in OPTIONAL_COLUMNS
+            )
+            
+            insert_sql = """
+            INSERT INTO enjo_cases (
+                title, incident_text, incident_date, cause_category, 
+                reasoning_text, company_info, media_url, response_text, outcome
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """
+            
             imported_count = 0
-            for row in reader:
-                # データの準備
-                data = {
-                    'title': row['title'].strip(),
-                    'incident_text': row['incident_text'].strip(),
-                    'incident_date': row['incident_date'].strip(),
-                    'cause_category': row['cause_category'].strip(),
-                    'reasoning_text': row['reasoning_text'].strip(),
-                    'company_info': row.get('company_info', '').strip() or None,
-                    'media_url': row.get('media_url', '').strip() or None,
-                    'response_text': row.get('response_text', '').strip() or None,
-                    'outcome': row.get('outcome', '').strip() or None
-                }
-                
-                # データベースに挿入
-                insert_sql = """
-                INSERT INTO enjo_cases (
-                    title, incident_text, incident_date, cause_category, 
-                    reasoning_text, company_info, media_url, response_text, outcome
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                
-                cursor.execute(insert_sql, (
-                    data['title'],
-                    data['incident_text'],
-                    data['incident_date'],
-                    data['cause_category'],
-                    data['reasoning_text'],
-                    data['company_info'],
-                    data['media_url'],
-                    data['response_text'],
-                    data['outcome']
-                ))
-                
-                imported_count += 1
-                print(f"インポート完了: {data['title']}")
+            
+            def generate_rows(normalized_chunks):
+                """整形済みの行を挿入用に1行ずつ取り出す"""
+                nonlocal imported_count
+                for rows in normalized_chunks:
+                    yield from rows
+                    previous_count = imported_count
+                    imported_count += len(rows)
+                    if imported_count // PROGRESS_INTERVAL > previous_count // PROGRESS_INTERVAL:
+                        print(f"インポート中: {imported_count}件")
+            
+            use_pool = os.path.getsize(csv_file_path) >= PARALLEL_THRESHOLD_BYTES and (os.cpu_count() or 1) > 1
+            normalize = partial(_normalize_rows, positions=positions)
+            
+            # 取り込み中はfsyncを省略し、全行を1トランザクションでまとめて挿入する
+            cursor.execute("PRAGMA synchronous=OFF")
+            cursor.execute("BEGIN")
+            with (Pool() if use_pool else nullcontext()) as pool:
+                # 並列時も imap で元の行順を保ったまま、このプロセスだけが書き込む
+                chunks = _iter_chunks(reader, CHUNK_ROWS)
+                normalized_chunks = pool.imap(normalize, chunks) if pool else map(normalize, chunks)
+                cursor.executemany(insert_sql, generate_rows(normalized_chunks))
+            
+            create_date_index(cursor)
             
             # 変更をコミット
             conn.commit()
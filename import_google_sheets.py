@@ -8,6 +8,32 @@ Google Sheets APIを使用
 import sqlite3
 import os
 from datetime import datetime
+from itertools import chain
+
+from import_csv_data import create_category_priority, create_date_index, create_search_index
+
+# 1行あたりの列数と、1文で挿入する行数（SQLITE_MAX_VARIABLE_NUMBER の既定値 999 に収まる範囲）
+COLUMNS_PER_ROW = 9
+ROWS_PER_STATEMENT = 999 // COLUMNS_PER_ROW
+
+INSERT_SQL_PREFIX = """
+INSERT INTO enjo_cases (
+    title, incident_text, incident_date, cause_category, 
+    reasoning_text, company_info, media_url, response_text, outcome
+)
+VALUES """
+ROW_PLACEHOLDERS = "(" + ", ".join(["?"] * COLUMNS_PER_ROW) + ")"
+
+def _insert_rows(cursor, rows):
+    """複数行をまとめた INSERT 文で挿入する"""
+    full_sql = INSERT_SQL_PREFIX + ", ".join([ROW_PLACEHOLDERS] * ROWS_PER_STATEMENT)
+    for start in range(0, len(rows), ROWS_PER_STATEMENT):
+        chunk = rows[start:start + ROWS_PER_STATEMENT]
+        if len(chunk) == ROWS_PER_STATEMENT:
+            sql = full_sql
+        else:
+            sql = INSERT_SQL_PREFIX + ", ".join([ROW_PLACEHOLDERS] * len(chunk))
+        cursor.execute(sql, list(chain.from_iterable(chunk)))
 
 def import_from_google_sheets(sheet_id: str, sheet_name: str = "Sheet1", db_path: str = "enjo_cases.db"):
     """Google Sheetsから直接データをインポートする"""
@@ -43,54 +69,42 @@ def import_from_google_sheets(sheet_id: str, sheet_name: str = "Sheet1", db_path
             print("スプレッドシートにデータが見つかりません")
             return False
         
-        # データベース接続
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        imported_count = 0
+        # 挿入用のタプルにまとめる（必須フィールドが欠けた行はスキップ）
+        rows = []
         for record in records:
             # データの準備
-            data = {
-                'title': record.get('title', '').strip(),
-                'incident_text': record.get('incident_text', '').strip(),
-                'incident_date': record.get('incident_date', '').strip(),
-                'cause_category': record.get('cause_category', '').strip(),
-                'reasoning_text': record.get('reasoning_text', '').strip(),
-                'company_info': record.get('company_info', '').strip() or None,
-                'media_url': record.get('media_url', '').strip() or None,
-                'response_text': record.get('response_text', '').strip() or None,
-                'outcome': record.get('outcome', '').strip() or None
-            }
+            row = (
+                record.get('title', '').strip(),
+                record.get('incident_text', '').strip(),
+                record.get('incident_date', '').strip(),
+                record.get('cause_category', '').strip(),
+                record.get('reasoning_text', '').strip(),
+                record.get('company_info', '').strip() or None,
+                record.get('media_url', '').strip() or None,
+                record.get('response_text', '').strip() or None,
+                record.get('outcome', '').strip() or None
+            )
             
             # 必須フィールドのチェック
-            if not all([data['title'], data['incident_text'], data['incident_date'], 
-                       data['cause_category'], data['reasoning_text']]):
-                print(f"スキップ: 必須フィールドが不足しています - {data['title']}")
+            if not all(row[:5]):
+                print(f"スキップ: 必須フィールドが不足しています - {row[0]}")
                 continue
             
-            # データベースに挿入
-            insert_sql = """
-            INSERT INTO enjo_cases (
-                title, incident_text, incident_date, cause_category, 
-                reasoning_text, company_info, media_url, response_text, outcome
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
-            
-            cursor.execute(insert_sql, (
-                data['title'],
-                data['incident_text'],
-                data['incident_date'],
-                data['cause_category'],
-                data['reasoning_text'],
-                data['company_info'],
-                data['media_url'],
-                data['response_text'],
-                data['outcome']
-            ))
-            
-            imported_count += 1
-            print(f"インポート完了: {data['title']}")
+            rows.append(row)
+        
+        # データベース接続
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        
+        # 関連事例検索用の全文検索インデックスを用意し、以降の挿入はトリガーで同期する
+        create_search_index(cursor)
+        create_category_priority(cursor)
+        create_date_index(cursor)
+        
+        # 全行を1トランザクションでまとめて挿入する
+        cursor.execute("BEGIN")
+        _insert_rows(cursor, rows)
+        imported_count = len(rows)
         
         # 変更をコミット
         conn.commit()
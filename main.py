@@ -4,14 +4,19 @@
 炎上リスク分析API - Vercel互換版
 """
 
+import asyncio
 import os
-import sqlite3
 import re
-from typing import List, Dict, Any
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional, Tuple
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
+from risk_rules import score_text
+from ttl_cache import TTLCache
+
 # FastAPIアプリケーションの初期化
 app = FastAPI(
     title="炎上リスク分析API",
@@ -31,6 +36,35 @@ app.add_middleware(
 # データベースファイルのパス
 DB_PATH = "enjo_cases.db"
 
+# 接続時に設定するSQLiteのプラグマ（検索専用の接続向け。いずれも接続ごとの設定で、ファイルには記録されない）
+# ジャーナルモードはファイルに記録され、WALにすると読み取り専用のデプロイ先で開けなくなるため変更しない
+DB_PRAGMAS = (
+    "PRAGMA query_only=ON",         # 誤ってデータベースファイルを書き換えないようにする
+    "PRAGMA mmap_size=1073741824",  # 1GiBまでメモリマップで読む
+    "PRAGMA cache_size=-20000",     # ページキャッシュ約20MB
+    "PRAGMA temp_store=MEMORY",     # 並べ替え用の一時B木をメモリ上に置く
+)
+
+# 関連事例の検索で取得する列（SELECT句と同じ並び。行はタプルのまま受け取り、列名と組み合わせる）
+_RELATED_CASE_COLUMNS = ("incident_id", "title", "incident_text", "incident_date", "cause_category", "reasoning_text")
+
+# 分析結果キャッシュの最大件数と有効期限（秒）。同じテキストの分析は検索も含めて再利用する
+RESPONSE_CACHE_SIZE = 4096
+RESPONSE_CACHE_TTL = 300
+
+# リクエスト間で共有するデータベース接続
+_db_conn: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
+
+# 関連事例検索のキーワードとして取り出す語（英数字・かな・漢字が2文字以上続く部分）
+_TOKEN_RE = re.compile(r'[A-Za-z0-9\u3040-\u30ff\u3400-\u9fff]{2,}')
+
+# リスク評価の表示（スコアを10で割った値で引く。70以上は高リスク、40以上は中リスク）
+_RISK_LEVELS = ("低リスク",) * 4 + ("中リスク",) * 3 + ("高リスク",) * 4
+
+# 分析結果のテキストのひな形
+_ANALYSIS_TEMPLATE = "分析結果:\n総合リスクスコア: {score}/100\n原因カテゴリ: {category}\n信頼度: {confidence}\nリスク評価: {level}\n関連事例: {count}件"
+
 # Pydanticモデル
 class AnalyzeRequest(BaseModel):
     text: str = Field(..., min_length=1, max_length=1000)
@@ -48,6 +82,9 @@ class RelatedCase(BaseModel):
     cause_category: str
     reasoning_text: str
 
+# 関連事例はスキーマの決まったデータベースの値なので、検証を省いて組み立てる（Pydantic v1では construct）
+_construct_related_case = getattr(RelatedCase, 'model_construct', None) or RelatedCase.construct
+
 class AnalyzeResponse(BaseModel):
     input_text: str
     risk_score: RiskScore
@@ -55,48 +92,28 @@ class AnalyzeResponse(BaseModel):
     related_cases: List[RelatedCase]
 
 def get_database_connection():
-    """データベース接続を取得する"""
+    """共有のデータベース接続を取得する（初回呼び出し時に接続する）"""
+    global _db_conn
     try:
-        if not os.path.exists(DB_PATH):
-            return None
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        return conn
+        with _db_lock:
+            if _db_conn is None:
+                if not os.path.exists(DB_PATH):
+                    return None
+                conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+                for pragma in DB_PRAGMAS:
+                    try:
+                        conn.execute(pragma)
+                    except sqlite3.Error:
+                        pass  # 読み取り専用の環境では既定の設定のまま使う
+                _db_conn = conn
+            return _db_conn
     except Exception:
         return None
 
 def calculate_risk_score(text: str) -> RiskScore:
     """リスクスコア計算"""
-    score = 10
-    category = "その他"
-    
-    # 高リスクパターン
-    if re.search(r'殺害|殺す|死ね|死ぬ|殺人', text, re.IGNORECASE):
-        score += 40
-        category = "極めて危険な表現"
-    elif re.search(r'女性|男性|男|女|性別', text, re.IGNORECASE):
-        score += 30
-        category = "差別的表現"
-    elif re.search(r'差別|偏見|見下す', text, re.IGNORECASE):
-        score += 30
-        category = "差別的表現"
-    elif re.search(r'暴力|暴行|殴る|蹴る', text, re.IGNORECASE):
-        score += 35
-        category = "暴力的表現"
-    elif re.search(r'クソ|くそ|最悪|ひどい', text, re.IGNORECASE):
-        score += 25
-        category = "不適切な表現"
-    elif re.search(r'残業|給料|労働', text, re.IGNORECASE):
-        score += 20
-        category = "労働問題"
-    elif re.search(r'環境|地球|温暖化', text, re.IGNORECASE):
-        score += 15
-        category = "社会的責任"
-    elif re.search(r'税金|政治|政府', text, re.IGNORECASE):
-        score += 15
-        category = "社会問題"
+    score, category = score_text(text)
     
-    score = min(100, max(0, score))
     confidence = min(1.0, len(text) / 100)
     
     return RiskScore(
@@ -107,47 +124,72 @@ def calculate_risk_score(text: str) -> RiskScore:
 
 def search_related_cases(text: str, limit: int = 3) -> List[Dict[str, Any]]:
     """関連事例を検索する"""
+    return _search_related_cases(text, limit) or []
+
+def _search_related_cases(text: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+    """関連事例を検索する（データベースに接続できない・検索に失敗した場合は None）"""
     conn = get_database_connection()
     if not conn:
-        return []
+        return None
     
     try:
-        cursor = conn.cursor()
-        keywords = [word for word in text.split() if len(word) >= 2][:5]
+        keywords = list(dict.fromkeys(_TOKEN_RE.findall(text)))[:5]
         
-        if keywords:
-            conditions = []
-            params = []
-            for keyword in keywords:
-                conditions.append("(title LIKE ? OR incident_text LIKE ? OR cause_category LIKE ?)")
-                params.extend([f"%{keyword}%", f"%{keyword}%", f"%{keyword}%"])
-            
-            where_clause = " OR ".join(conditions)
-            sql = f"""
-            SELECT incident_id, title, incident_text, incident_date, cause_category, reasoning_text
-            FROM enjo_cases
-            WHERE {where_clause}
-            ORDER BY incident_date DESC
-            LIMIT ?
-            """
-            params.append(limit)
-        else:
-            sql = """
-            SELECT incident_id, title, incident_text, incident_date, cause_category, reasoning_text
-            FROM enjo_cases
-            ORDER BY incident_date DESC
-            LIMIT ?
-            """
-            params = [limit]
+        # 3文字以上のキーワードは全文検索インデックス（trigram）で、短いものはLIKEで照合する
+        fts_keywords = [keyword for keyword in keywords if len(keyword) >= 3]
+        like_keywords = [keyword for keyword in keywords if len(keyword) < 3]
         
-        cursor.execute(sql, params)
-        results = cursor.fetchall()
-        return [dict(row) for row in results]
+        try:
+            return _query_related_cases(conn, fts_keywords, like_keywords, limit)
+        except sqlite3.OperationalError:
+            # 全文検索インデックスが未作成の場合はすべてLIKE検索で代替する
+            return _query_related_cases(conn, [], keywords, limit)
         
     except Exception:
-        return []
-    finally:
-        conn.close()
+        return None
+
+def _build_fts_query(keywords: List[str]) -> str:
+    """全文検索（FTS5）用のMATCH式を組み立てる（タイトル・本文・カテゴリのいずれかに含むもの）"""
+    phrases = " OR ".join('"' + keyword.replace('"', '""') + '"' for keyword in keywords)
+    return "{title incident_text cause_category} : (" + phrases + ")"
+
+def _query_related_cases(conn: sqlite3.Connection, fts_keywords: List[str], like_keywords: List[str],
+                         limit: int) -> List[Dict[str, Any]]:
+    """キーワードのいずれかを含む事例を新しい順に取得する"""
+    conditions = []
+    params = []
+    
+    if fts_keywords:
+        conditions.append("incident_id IN (SELECT rowid FROM enjo_fts WHERE enjo_fts MATCH ?)")
+        params.append(_build_fts_query(fts_keywords))
+    
+    for keyword in like_keywords:
+        conditions.append("(title LIKE ? OR incident_text LIKE ? OR cause_category LIKE ?)")
+        params.extend([f"%{keyword}%", f"%{keyword}%", f"%{keyword}%"])
+    
+    if conditions:
+        where_clause = " OR ".join(conditions)
+        sql = f"""
+        SELECT incident_id, title, incident_text, incident_date, cause_category, reasoning_text
+        FROM enjo_cases
+        WHERE {where_clause}
+        ORDER BY incident_date DESC
+        LIMIT ?
+        """
+        params.append(limit)
+    else:
+        sql = """
+        SELECT incident_id, title, incident_text, incident_date, cause_category, reasoning_text
+        FROM enjo_cases
+        ORDER BY incident_date DESC
+        LIMIT ?
+        """
+        params = [limit]
+    
+    # 同じSQL文はsqlite3モジュールの文キャッシュで準備済みのものが再利用される
+    with _db_lock:
+        results = conn.execute(sql, params).fetchall()
+    return [dict(zip(_RELATED_CASE_COLUMNS, row)) for row in results]
 
 @app.get("/")
 async def root():
@@ -162,10 +204,8 @@ async def health_check():
     try:
         conn = get_database_connection()
         if conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM enjo_cases")
-            count = cursor.fetchone()[0]
-            conn.close()
+            with _db_lock:
+                count = conn.execute("SELECT COUNT(*) FROM enjo_cases").fetchone()[0]
             return {
                 "status": "healthy",
                 "database_records": count,
@@ -182,29 +222,49 @@ async def health_check():
             "error": str(e)
         }
 
+def _analyze(text: str) -> Tuple[AnalyzeResponse, bool]:
+    """テキストを分析し、(分析結果, キャッシュしてよいか) を返す"""
+    risk_score = calculate_risk_score(text)
+    # 関連事例を検索（失敗した場合は関連事例なしで応答し、その結果はキャッシュしない）
+    related_cases_data = _search_related_cases(text, 3)
+    cacheable = related_cases_data is not None
+    if not cacheable:
+        related_cases_data = []
+    
+    analysis_text = _ANALYSIS_TEMPLATE.format(
+        score=risk_score.overall_score,
+        category=risk_score.category,
+        confidence=risk_score.confidence,
+        level=_RISK_LEVELS[risk_score.overall_score // 10],
+        count=len(related_cases_data)
+    )
+    
+    related_cases = [_construct_related_case(**case) for case in related_cases_data]
+    
+    response = AnalyzeResponse(
+        input_text=text,
+        risk_score=risk_score,
+        analysis_text=analysis_text,
+        related_cases=related_cases
+    )
+    return response, cacheable
+
+# 分析結果のキャッシュ（イベントループ上からのみ読み書きする）
+_response_cache = TTLCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+
 @app.post("/analyze", response_model=AnalyzeResponse)
 async def analyze_text(request: AnalyzeRequest):
     try:
-        risk_score = calculate_risk_score(request.text)
-        related_cases_data = search_related_cases(request.text, limit=3)
-        
-        risk_level = "高リスク" if risk_score.overall_score >= 70 else "中リスク" if risk_score.overall_score >= 40 else "低リスク"
-        
-        analysis_text = f"""分析結果:
-総合リスクスコア: {risk_score.overall_score}/100
-原因カテゴリ: {risk_score.category}
-信頼度: {risk_score.confidence}
-リスク評価: {risk_level}
-関連事例: {len(related_cases_data)}件"""
-        
-        related_cases = [RelatedCase(**case) for case in related_cases_data]
+        # 同じテキストの分析結果が有効期限内にあれば再利用する
+        cached = _response_cache.get(request.text)
+        if cached is not None:
+            return cached
         
-        return AnalyzeResponse(
-            input_text=request.text,
-            risk_score=risk_score,
-            analysis_text=analysis_text,
-            related_cases=related_cases
-        )
+        # 分析にはデータベースの読み取りが含まれるため、スレッドで実行してイベントループを止めない
+        response, cacheable = await asyncio.to_thread(_analyze, request.text)
+        if cacheable:
+            _response_cache.set(request.text, response)
+        return response
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"分析中にエラーが発生しました: {str(e)}")
@@ -9,13 +9,23 @@ SQLiteデータベースから類似事例を検索し、Gemini APIでリスク
 import os
 import sqlite3
 import re
-from typing import List, Dict, Any
+import asyncio
+import hashlib
+import math
+import operator
+import struct
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-import google.generativeai as genai
 from dotenv import load_dotenv
 
+from advanced_scoring import KeywordMatcher
+from import_csv_data import category_priority_sql
+from ttl_cache import TTLCache
+
 # 環境変数の読み込み
 load_dotenv()
 
@@ -43,20 +53,90 @@ if not GEMINI_API_KEY:
     if os.getenv('VERCEL'):
         raise ValueError("GEMINI_API_KEY環境変数が設定されていません")
 
-# Gemini APIが設定されている場合のみ初期化
-if GEMINI_API_KEY and GEMINI_API_KEY != 'your_gemini_api_key_here':
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-1.5-flash')
-    except Exception as e:
-        print(f"Gemini API初期化エラー: {e}")
-        model = None
-else:
-    model = None
+# Gemini APIのクライアント（SDKの読み込みは重いため、起動時ではなく初めて使うときに初期化する）
+_genai = None
+_model = None
+_model_initialized = False
+_model_lock = threading.Lock()
+
+def _get_model():
+    """Geminiのモデルを取得する（APIキーが未設定または初期化に失敗した場合はNone）"""
+    global _genai, _model, _model_initialized
+    if not _model_initialized:
+        # 初期化はスレッドから呼ばれるため、同時に呼ばれても1回だけ行う
+        with _model_lock:
+            if not _model_initialized:
+                if GEMINI_API_KEY and GEMINI_API_KEY != 'your_gemini_api_key_here':
+                    try:
+                        import google.generativeai as genai
+                        genai.configure(api_key=GEMINI_API_KEY)
+                        _model = genai.GenerativeModel('gemini-1.5-flash')
+                        _genai = genai
+                    except Exception as e:
+                        print(f"Gemini API初期化エラー: {e}")
+                _model_initialized = True
+    return _model
 
 # データベースファイルのパス
 DB_PATH = "enjo_cases.db"
 
+# 接続時に設定するSQLiteのプラグマ（検索専用の接続向け。いずれも接続ごとの設定で、ファイルには記録されない）
+# ジャーナルモードはファイルに記録され、WALにすると読み取り専用のデプロイ先で開けなくなるため変更しない
+DB_PRAGMAS = (
+    "PRAGMA query_only=ON",         # 誤ってデータベースファイルを書き換えないようにする
+    "PRAGMA mmap_size=1073741824",  # 1GiBまでメモリマップで読む
+    "PRAGMA cache_size=-20000",     # ページキャッシュ約20MB
+    "PRAGMA temp_store=MEMORY",     # 並べ替え用の一時B木をメモリ上に置く
+)
+
+# 関連事例の検索で取得する列（SELECT句と同じ並び。行はタプルのまま受け取り、列名と組み合わせる）
+_RELATED_CASE_COLUMNS = (
+    "incident_id", "title", "incident_text", "incident_date", "cause_category",
+    "reasoning_text", "company_info", "media_url", "response_text", "outcome",
+)
+
+# リクエスト間で共有するデータベース接続
+_db_conn: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
+
+# 関連事例をカテゴリの重要度順に並べる式（category_priority 列があればインデックスを使う）
+_category_order_sql = category_priority_sql()
+
+# 分析結果キャッシュの最大件数と有効期限（秒）
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 300
+
+# 意味的に近い入力の分析結果を再利用するためのキャッシュ設定
+EMBEDDING_MODEL = "models/text-embedding-004"
+SEMANTIC_CACHE_SIZE = 256
+SEMANTIC_CACHE_THRESHOLD = 0.9  # この値以上のコサイン類似度なら同じ投稿とみなす
+SEMANTIC_CACHE_SCORE_BAND = 20  # 分析文を再利用する総合スコアの幅（同じ帯の入力どうしでのみ再利用する）
+
+# 埋め込みキャッシュ（メモリ上の件数と、再起動後も使える保存先ファイル）
+EMBEDDING_MEMORY_CACHE_SIZE = 1024
+EMBEDDING_CACHE_PATH = "embedding_cache.db"
+
+# この文字数未満でリスク要因が1つも見つからない入力は、事例検索とGemini APIを省いて低リスクとして返す
+TRIVIAL_TEXT_LENGTH = 32
+
+# Gemini APIへの同時リクエスト数の上限（超えた分は順番待ちにしてレート制限を避ける）
+GEMINI_MAX_CONCURRENCY = 4
+
+# キーワード照合の加算先インデックス
+_LEGAL_BUCKET = 0
+_BRAND_BUCKET = 1
+_SOCIAL_BUCKET = 2
+_CATEGORY_BUCKET_OFFSET = 3
+
+# 推奨事項の判定条件（スコアの項目, 比較方法, しきい値, 推奨事項）。該当するものを定義順に返す
+RECOMMENDATION_RULES = (
+    ('legal_risk', operator.ge, 60, "法的リスクが高いため、法務部門との相談を推奨"),
+    ('brand_risk', operator.ge, 60, "ブランドイメージへの影響が大きいため、広報戦略の見直しが必要"),
+    ('social_risk', operator.ge, 60, "社会的影響が予想されるため、SNS監視体制の強化を推奨"),
+    ('content_risk', operator.ge, 80, "コンテンツの全面的な見直しが必要"),
+    ('confidence', operator.lt, 0.5, "分析の信頼度が低いため、より詳細な分析を推奨"),
+)
+
 # 多要素スコアリングシステム
 class RiskScore(BaseModel):
     """詳細なリスクスコア"""
@@ -86,6 +166,9 @@ class RelatedCase(BaseModel):
     response_text: str = None
     outcome: str = None
 
+# 関連事例はスキーマの決まったデータベースの値なので、検証を省いて組み立てる（Pydantic v1では construct）
+_construct_related_case = getattr(RelatedCase, 'model_construct', None) or RelatedCase.construct
+
 class AnalyzeResponse(BaseModel):
     """分析結果のモデル（多要素スコアリング対応）"""
     input_text: str
@@ -104,7 +187,7 @@ class AdvancedScoringSystem:
             # 極めて高リスクパターン（重み: 4.0）
             'extreme_risk': {
                 'patterns': [
-                    r'殺害|殺す|死ね|死ぬ|殺人|殺し|殺して|殺せ',
+                    r'殺害|殺す|死ね|死ぬ|殺人|殺して|殺し|殺せ',
                     r'老人|高齢者|年寄り|お年寄り',
                     r'障害者|障がい者|身体障害|知的障害',
                     r'外国人|移民|在日|朝鮮|中国|韓国',
@@ -179,135 +262,130 @@ class AdvancedScoringSystem:
             '社会問題': ['税金', '政治', '政府', '国', '社会', '差別', '偏見', '人権'],
             '人権侵害': ['老人', '高齢者', '障害者', '外国人', '移民', '女性', '男性', 'LGBT']
         }
+        
+        # 全段階のパターンを1本の正規表現にまとめて初期化時にコンパイルし、1回の走査で数える
+        # （グループ番号 - 1 がパターンの通し番号になり、対応する重みと基本スコアを引ける）
+        content_patterns = [
+            (pattern, config['weight'], config['base_score'])
+            for config in self.risk_patterns.values()
+            for pattern in config['patterns']
+        ]
+        self._content_re = re.compile(
+            '|'.join(f'({pattern})' for pattern, _, _ in content_patterns),
+            re.IGNORECASE
+        )
+        self._content_group_scores = tuple(weight * base_score for _, weight, base_score in content_patterns)
+        
+        # 原因カテゴリのキーワード
+        self.category_keywords = {
+            '極めて危険な表現': ['殺害', '殺す', '死ね', '死ぬ', '殺人', '暴力', '暴行'],
+            '差別的表現': ['女性', '男性', '男', '女', '性別', '結婚', '妊娠', '老人', '高齢者', '障害者', '外国人', '移民', 'LGBT'],
+            '誹謗中傷': ['パクリ', '盗作', 'コピー', '真似', '卑劣', '馬鹿', 'アホ', 'バカ', 'クズ', 'ゴミ'],
+            '個人情報漏洩': ['住所', '電話', '個人情報', '名前', 'メール'],
+            '労働問題': ['残業', '給料', '労働', '働く', '従業員'],
+            '不適切な表現': ['クソ', 'くそ', '最悪', 'ひどい', 'ダメ', 'だめ', 'うざい', 'うっとうしい'],
+            '情報隠蔽': ['完璧', '問題ない', 'デマ', '嘘', '隠蔽'],
+            '社会的責任の欠如': ['環境', '地球', '温暖化', 'CO2', 'エコ'],
+            '社会問題への偏見': ['税金', '政治', '政府', '国', '社会'],
+            '趣味嗜好への差別': ['アニメ', 'ゲーム', '趣味', '文化', '遅れ'],
+            '人権侵害': ['差別', '偏見', '見下す', '老人', '高齢者', '障害者', '外国人']
+        }
+        
+        # 全キーワードを1つの照合器にまとめ、加算先と加点を行ごとの並列配列に展開する
+        # 加算先: 0=法的リスク, 1=ブランドリスク, 2=社会的リスク, 3以降=原因カテゴリ（定義順）
+        # （同じキーワードが複数の要因に含まれる場合は、その数だけ加点する）
+        self._category_names = tuple(self.category_keywords)
+        self._num_buckets = _CATEGORY_BUCKET_OFFSET + len(self._category_names)
+        
+        bucket_keywords = [
+            (_LEGAL_BUCKET, 20, self.legal_risk_factors.values()),    # 各法的リスク要因で20点追加
+            (_BRAND_BUCKET, 15, self.brand_risk_factors.values()),    # 各ブランドリスク要因で15点追加
+            (_SOCIAL_BUCKET, 10, self.social_risk_factors.values()),  # 各社会的リスク要因で10点追加
+        ]
+        for index, name in enumerate(self._category_names):
+            bucket_keywords.append((_CATEGORY_BUCKET_OFFSET + index, 1, [self.category_keywords[name]]))
+        
+        row_bucket: List[int] = []
+        row_points: List[int] = []
+        keyword_rows: Dict[str, List[int]] = {}
+        for bucket, points, keyword_lists in bucket_keywords:
+            for keywords in keyword_lists:
+                for keyword in keywords:
+                    keyword_rows.setdefault(keyword, []).append(len(row_bucket))
+                    row_bucket.append(bucket)
+                    row_points.append(points)
+        
+        self._row_bucket = tuple(row_bucket)
+        self._row_points = tuple(row_points)
+        self._keyword_rows = {keyword: tuple(rows) for keyword, rows in keyword_rows.items()}
+        self._keyword_matcher = KeywordMatcher(self._keyword_rows)
 
     def analyze_text(self, text: str) -> RiskScore:
         """テキストを詳細分析してリスクスコアを算出"""
         
-        # 各要素のスコアを算出
-        content_risk = self._calculate_content_risk(text)
-        legal_risk = self._calculate_legal_risk(text)
-        brand_risk = self._calculate_brand_risk(text)
-        social_risk = self._calculate_social_risk(text)
+        # テキストを1回だけ走査して各要素のスコアを算出
+        scan = self._scan(text)
         
         # 総合スコアを算出（重み付け平均）
         overall_score = self._calculate_overall_score(
-            content_risk, legal_risk, brand_risk, social_risk
+            scan['content'], scan['legal'], scan['brand'], scan['social']
         )
         
-        # 原因カテゴリを特定
-        category = self._identify_category(text)
-        
-        # 信頼度を算出
-        confidence = self._calculate_confidence(text)
+        # 信頼度を算出（コンテンツリスクで数えたキーワード数を再利用）
+        confidence = self._calculate_confidence(len(text), scan['total_matches'])
         
         return RiskScore(
             overall_score=overall_score,
-            content_risk=content_risk,
-            legal_risk=legal_risk,
-            brand_risk=brand_risk,
-            social_risk=social_risk,
-            category=category,
+            content_risk=scan['content'],
+            legal_risk=scan['legal'],
+            brand_risk=scan['brand'],
+            social_risk=scan['social'],
+            category=scan['category'],
             confidence=confidence
         )
 
-    def _calculate_content_risk(self, text: str) -> int:
-        """コンテンツリスクを算出"""
-        score = 0
+    def _scan(self, text: str) -> Dict[str, Any]:
+        """テキストを走査し、各要素のスコア・原因カテゴリ・キーワード数をまとめて算出"""
+        # コンテンツリスク（リスクパターンの一致）
+        content_score = 0
         total_matches = 0
+        group_scores = self._content_group_scores
+        for match in self._content_re.finditer(text):
+            content_score += group_scores[match.lastindex - 1]
+            total_matches += 1
+        
+        # 法的・ブランド・社会的リスクと原因カテゴリ（キーワードの一括照合）
+        row_bucket = self._row_bucket
+        row_points = self._row_points
+        bucket_scores = [0] * self._num_buckets
+        for keyword in self._keyword_matcher.find(text):
+            for row in self._keyword_rows[keyword]:
+                bucket_scores[row_bucket[row]] += row_points[row]
+        
+        # 最もスコアの高いカテゴリ（同点の場合は定義順で先のもの）
+        if self._category_names:
+            best = max(range(_CATEGORY_BUCKET_OFFSET, self._num_buckets), key=bucket_scores.__getitem__)
+            category = self._category_names[best - _CATEGORY_BUCKET_OFFSET]
+        else:
+            category = 'その他'
         
-        for risk_level, config in self.risk_patterns.items():
-            for pattern in config['patterns']:
-                matches = len(re.findall(pattern, text, re.IGNORECASE))
-                if matches > 0:
-                    score += matches * config['weight'] * config['base_score']
-                    total_matches += matches
-        
-        if total_matches == 0:
-            return 10  # デフォルト値
-        
-        return min(100, int(score / total_matches))
-
-    def _calculate_legal_risk(self, text: str) -> int:
-        """法的リスクを算出"""
-        legal_score = 0
-        
-        for law, keywords in self.legal_risk_factors.items():
-            for keyword in keywords:
-                if keyword in text:
-                    legal_score += 20  # 各法的リスク要因で20点追加
-        
-        return min(100, legal_score)
-
-    def _calculate_brand_risk(self, text: str) -> int:
-        """ブランドリスクを算出"""
-        brand_score = 0
-        
-        for risk_type, keywords in self.brand_risk_factors.items():
-            for keyword in keywords:
-                if keyword in text:
-                    brand_score += 15  # 各ブランドリスク要因で15点追加
-        
-        return min(100, brand_score)
-
-    def _calculate_social_risk(self, text: str) -> int:
-        """社会的リスクを算出"""
-        social_score = 0
-        
-        for risk_type, keywords in self.social_risk_factors.items():
-            for keyword in keywords:
-                if keyword in text:
-                    social_score += 10  # 各社会的リスク要因で10点追加
-        
-        return min(100, social_score)
+        return {
+            'content': min(100, int(content_score / total_matches)) if total_matches else 10,  # 一致なしはデフォルト値
+            'legal': min(100, bucket_scores[_LEGAL_BUCKET]),
+            'brand': min(100, bucket_scores[_BRAND_BUCKET]),
+            'social': min(100, bucket_scores[_SOCIAL_BUCKET]),
+            'category': category,
+            'total_matches': total_matches
+        }
 
     def _calculate_overall_score(self, content: int, legal: int, brand: int, social: int) -> int:
         """総合スコアを算出（重み付け平均）"""
         # 重み付け: コンテンツ40%, 法的30%, ブランド20%, 社会的10%
-        weights = [0.4, 0.3, 0.2, 0.1]
-        scores = [content, legal, brand, social]
-        
-        weighted_score = sum(score * weight for score, weight in zip(scores, weights))
-        return int(weighted_score)
+        return int(content * 0.4 + legal * 0.3 + brand * 0.2 + social * 0.1)
 
-    def _identify_category(self, text: str) -> str:
-        """原因カテゴリを特定"""
-        category_scores = {}
-        
-        categories = {
-            '極めて危険な表現': ['殺害', '殺す', '死ね', '死ぬ', '殺人', '暴力', '暴行'],
-            '差別的表現': ['女性', '男性', '男', '女', '性別', '結婚', '妊娠', '老人', '高齢者', '障害者', '外国人', '移民', 'LGBT'],
-            '誹謗中傷': ['パクリ', '盗作', 'コピー', '真似', '卑劣', '馬鹿', 'アホ', 'バカ', 'クズ', 'ゴミ'],
-            '個人情報漏洩': ['住所', '電話', '個人情報', '名前', 'メール'],
-            '労働問題': ['残業', '給料', '労働', '働く', '従業員'],
-            '不適切な表現': ['クソ', 'くそ', '最悪', 'ひどい', 'ダメ', 'だめ', 'うざい', 'うっとうしい'],
-            '情報隠蔽': ['完璧', '問題ない', 'デマ', '嘘', '隠蔽'],
-            '社会的責任の欠如': ['環境', '地球', '温暖化', 'CO2', 'エコ'],
-            '社会問題への偏見': ['税金', '政治', '政府', '国', '社会'],
-            '趣味嗜好への差別': ['アニメ', 'ゲーム', '趣味', '文化', '遅れ'],
-            '人権侵害': ['差別', '偏見', '見下す', '老人', '高齢者', '障害者', '外国人']
-        }
-        
-        for category, keywords in categories.items():
-            score = 0
-            for keyword in keywords:
-                if keyword in text:
-                    score += 1
-            category_scores[category] = score
-        
-        # 最もスコアの高いカテゴリを返す
-        if category_scores:
-            return max(category_scores, key=category_scores.get)
-        return 'その他'
-
-    def _calculate_confidence(self, text: str) -> float:
+    def _calculate_confidence(self, text_length: int, keyword_count: int) -> float:
         """分析の信頼度を算出"""
-        # テキストの長さとキーワードの多さに基づいて信頼度を算出
-        text_length = len(text)
-        keyword_count = sum(len(re.findall(pattern, text, re.IGNORECASE)) 
-                           for config in self.risk_patterns.values() 
-                           for pattern in config['patterns'])
-        
-        # 信頼度の計算（0.0-1.0）
+        # テキストの長さとキーワードの多さに基づいて信頼度を算出（0.0-1.0）
         length_factor = min(1.0, text_length / 100)  # 100文字で1.0
         keyword_factor = min(1.0, keyword_count / 5)  # 5個のキーワードで1.0
         
@@ -316,50 +394,68 @@ class AdvancedScoringSystem:
 
     def get_recommendations(self, risk_score: RiskScore) -> List[str]:
         """リスクスコアに基づく推奨事項を生成"""
-        recommendations = []
-        
-        if risk_score.legal_risk >= 60:
-            recommendations.append("法的リスクが高いため、法務部門との相談を推奨")
-        
-        if risk_score.brand_risk >= 60:
-            recommendations.append("ブランドイメージへの影響が大きいため、広報戦略の見直しが必要")
-        
-        if risk_score.social_risk >= 60:
-            recommendations.append("社会的影響が予想されるため、SNS監視体制の強化を推奨")
-        
-        if risk_score.content_risk >= 80:
-            recommendations.append("コンテンツの全面的な見直しが必要")
-        
-        if risk_score.confidence < 0.5:
-            recommendations.append("分析の信頼度が低いため、より詳細な分析を推奨")
-        
-        return recommendations
+        return [
+            message
+            for field, compare, threshold, message in RECOMMENDATION_RULES
+            if compare(getattr(risk_score, field), threshold)
+        ]
 
 # グローバルスコアリングシステムインスタンス
 scoring_system = AdvancedScoringSystem()
 
 def get_database_connection():
-    """データベース接続を取得する"""
-    if not os.path.exists(DB_PATH):
-        raise HTTPException(status_code=500, detail="データベースファイルが見つかりません")
-    
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row  # 辞書形式で結果を取得
-    return conn
+    """共有のデータベース接続を取得する（初回呼び出し時に接続する）"""
+    global _db_conn, _category_order_sql
+    with _db_lock:
+        if _db_conn is None:
+            if not os.path.exists(DB_PATH):
+                raise HTTPException(status_code=500, detail="データベースファイルが見つかりません")
+            
+            conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+            for pragma in DB_PRAGMAS:
+                try:
+                    conn.execute(pragma)
+                except sqlite3.Error:
+                    pass  # 読み取り専用の環境では既定の設定のまま使う
+            columns = [column[1] for column in conn.execute("PRAGMA table_xinfo(enjo_cases)")]
+            if 'category_priority' in columns:
+                _category_order_sql = 'category_priority'
+            _db_conn = conn
+        return _db_conn
 
 def search_related_cases(text: str, limit: int = 3) -> List[Dict[str, Any]]:
     """入力テキストに関連する炎上事例を検索する（改良版）"""
     conn = get_database_connection()
-    cursor = conn.cursor()
     
     # キーワードを抽出（改良版）
     keywords = extract_keywords_advanced(text)
     
     # 関連事例を検索（改良版）
+    # 3文字以上のキーワードは全文検索インデックス（trigram）で、短いものはLIKEで照合する
+    fts_keywords = [keyword for keyword in keywords if len(keyword) >= 3]
+    like_keywords = [keyword for keyword in keywords if len(keyword) < 3]
+    
+    try:
+        return _query_related_cases(conn, fts_keywords, like_keywords, limit)
+    except sqlite3.OperationalError:
+        # 全文検索インデックスが未作成の場合はすべてLIKE検索で代替する
+        return _query_related_cases(conn, [], keywords, limit)
+
+def _build_fts_query(keywords: List[str]) -> str:
+    """全文検索（FTS5）用のMATCH式を組み立てる"""
+    return " OR ".join('"' + keyword.replace('"', '""') + '"' for keyword in keywords)
+
+def _query_related_cases(conn: sqlite3.Connection, fts_keywords: List[str], like_keywords: List[str],
+                         limit: int) -> List[Dict[str, Any]]:
+    """キーワードのいずれかを含む事例を、カテゴリの重要度と日付の順に取得する"""
     search_conditions = []
     search_params = []
     
-    for keyword in keywords:
+    if fts_keywords:
+        search_conditions.append("incident_id IN (SELECT rowid FROM enjo_fts WHERE enjo_fts MATCH ?)")
+        search_params.append(_build_fts_query(fts_keywords))
+    
+    for keyword in like_keywords:
         search_conditions.append("(title LIKE ? OR incident_text LIKE ? OR cause_category LIKE ? OR reasoning_text LIKE ?)")
         search_params.extend([f"%{keyword}%", f"%{keyword}%", f"%{keyword}%", f"%{keyword}%"])
     
@@ -370,21 +466,7 @@ def search_related_cases(text: str, limit: int = 3) -> List[Dict[str, Any]]:
                reasoning_text, company_info, media_url, response_text, outcome
         FROM enjo_cases
         WHERE {where_clause}
-        ORDER BY 
-            CASE cause_category 
-                WHEN '差別的表現' THEN 5
-                WHEN '誹謗中傷' THEN 5
-                WHEN '個人情報漏洩' THEN 5
-                WHEN '労働問題' THEN 4
-                WHEN '社会的責任の欠如' THEN 4
-                WHEN '情報隠蔽' THEN 4
-                WHEN '不適切な表現' THEN 3
-                WHEN '不謹慎な表現' THEN 3
-                WHEN '社会問題への偏見' THEN 3
-                WHEN '趣味嗜好への差別' THEN 2
-                ELSE 1
-            END DESC,
-            incident_date DESC
+        ORDER BY {_category_order_sql} DESC, incident_date DESC
         LIMIT ?
         """
         search_params.append(limit)
@@ -399,18 +481,17 @@ def search_related_cases(text: str, limit: int = 3) -> List[Dict[str, Any]]:
         """
         search_params = [limit]
     
-    cursor.execute(sql, search_params)
-    results = cursor.fetchall()
-    conn.close()
+    # 同じSQL文はsqlite3モジュールの文キャッシュで準備済みのものが再利用される
+    with _db_lock:
+        results = conn.execute(sql, search_params).fetchall()
     
-    return [dict(row) for row in results]
+    return [dict(zip(_RELATED_CASE_COLUMNS, row)) for row in results]
 
-def extract_keywords_advanced(text: str) -> List[str]:
-    """テキストからキーワードを抽出する（改良版）"""
-    keywords = []
-    
-    # 高リスクパターン（重み付け）
-    high_risk_patterns = {
+# キーワード抽出用のパターン（モジュール読み込み時に一度だけコンパイルする）
+# 高リスクパターン（重み付け）とそのカテゴリ
+_HIGH_RISK_KEYWORD_PATTERNS = [
+    (re.compile(pattern, re.IGNORECASE), category)
+    for pattern, category in {
         r'クソ|くそ|最悪|ひどい|ダメ|だめ|やばい': '不適切な表現',
         r'女性|男性|男|女|性別|結婚|妊娠': '差別的表現',
         r'パクリ|盗作|コピー|真似': '誹謗中傷',
@@ -421,68 +502,71 @@ def extract_keywords_advanced(text: str) -> List[str]:
         r'アニメ|ゲーム|趣味|文化|遅れ': '趣味嗜好',
         r'競合|他社|ライバル|対抗': '競合関係',
         r'完璧|問題ない|デマ|嘘|隠蔽': '情報隠蔽'
-    }
+    }.items()
+]
+
+# 感情表現（重複していた「絶対」のパターンを1つにまとめ、長い表現から先に照合する）
+_EMOTION_RE = re.compile(r'絶対に|絶対です|絶対だ|絶対|怒|悲|喜|驚|恐|嫌|愛|恨|妬|嫉|すごい|やばい|ひどい|最悪|最高|素晴らしい')
+
+# 否定表現
+_NEGATION_PATTERNS = [
+    re.compile(pattern) for pattern in [
+        r'禁止する|ない|無い|だめ|ダメ|禁止',
+        r'やめて|やめろ|やめるな',
+        r'買わないで|買わない|買うな'
+    ]
+]
+
+# 一般的な名詞（ひらがな・カタカナ・漢字が2文字以上続く部分）
+_NOUN_RE = re.compile(r'[ぁ-んァ-ヶ一-龯]{2,}')
+
+# 優先して返すキーワードに含まれる語（1回の検索で判定できるよう1本の正規表現にまとめる）
+_PRIORITY_MARKERS = ('不適切', '差別', '誹謗', '個人情報', '労働', '社会', '隠蔽')
+_PRIORITY_MARKER_RE = re.compile('|'.join(_PRIORITY_MARKERS))
+
+# カテゴリ名は入力によらず常にキーワードに加わるため、優先度は読み込み時に振り分けておく
+_PRIORITY_CATEGORIES = frozenset(
+    category for _, category in _HIGH_RISK_KEYWORD_PATTERNS if _PRIORITY_MARKER_RE.search(category)
+)
+_NORMAL_CATEGORIES = frozenset(
+    category for _, category in _HIGH_RISK_KEYWORD_PATTERNS if category not in _PRIORITY_CATEGORIES
+)
+
+def extract_keywords_advanced(text: str) -> List[str]:
+    """テキストからキーワードを抽出する（改良版）"""
+    keywords: set = set()
     
     # パターンマッチング
-    for pattern, category in high_risk_patterns.items():
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        keywords.extend(matches)
-        keywords.append(category)  # カテゴリも追加
+    for pattern, _ in _HIGH_RISK_KEYWORD_PATTERNS:
+        keywords.update(pattern.findall(text))
     
     # 感情表現の抽出
-    emotion_patterns = [
-        r'怒|悲|喜|驚|恐|嫌|愛|恨|妬|嫉',
-        r'すごい|やばい|ひどい|最悪|最高|素晴らしい',
-        r'絶対|絶対に|絶対だ|絶対です',
-        r'絶対に|絶対|絶対だ|絶対です'
-    ]
-    
-    for pattern in emotion_patterns:
-        matches = re.findall(pattern, text)
-        keywords.extend(matches)
+    keywords.update(_EMOTION_RE.findall(text))
     
     # 否定表現の抽出
-    negation_patterns = [
-        r'ない|無い|だめ|ダメ|禁止|禁止する',
-        r'やめて|やめろ|やめるな',
-        r'買うな|買わない|買わないで'
-    ]
-    
-    for pattern in negation_patterns:
-        matches = re.findall(pattern, text)
-        keywords.extend(matches)
+    for pattern in _NEGATION_PATTERNS:
+        keywords.update(pattern.findall(text))
     
     # 一般的な名詞の抽出（2文字以上）
-    words = re.findall(r'[ぁ-んァ-ヶ一-龯]{2,}', text)
-    keywords.extend([word for word in words if len(word) >= 2])
-    
-    # 重複除去と優先度付け
-    unique_keywords = list(set(keywords))
-    
-    # 高リスクキーワードを優先
-    priority_keywords = []
-    normal_keywords = []
+    keywords.update(_NOUN_RE.findall(text))
     
-    for keyword in unique_keywords:
-        if any(risk in keyword for risk in ['不適切', '差別', '誹謗', '個人情報', '労働', '社会', '隠蔽']):
-            priority_keywords.append(keyword)
+    # 高リスクキーワードを優先（カテゴリ名は振り分け済みのものをそのまま加える）
+    priority_keywords = set(_PRIORITY_CATEGORIES)
+    normal_keywords = set(_NORMAL_CATEGORIES)
+    for keyword in keywords:
+        if _PRIORITY_MARKER_RE.search(keyword):
+            priority_keywords.add(keyword)
         else:
-            normal_keywords.append(keyword)
+            normal_keywords.add(keyword)
     
     # 優先度の高いキーワードを先に、最大15個まで
-    result = priority_keywords[:10] + normal_keywords[:5]
+    result = list(priority_keywords)[:10] + list(normal_keywords)[:5]
     return result[:15]
 
-def extract_keywords(text: str) -> List[str]:
-    """後方互換性のための関数"""
-    return extract_keywords_advanced(text)
-
-def generate_gemini_prompt_advanced(input_text: str, related_cases: List[Dict[str, Any]], risk_score: RiskScore) -> str:
-    """Gemini API用のプロンプトを生成する（多要素スコアリング対応版）"""
-    
-    cases_text = ""
-    for i, case in enumerate(related_cases, 1):
-        cases_text += f"""
+def _format_related_cases(related_cases: List[Dict[str, Any]]) -> str:
+    """プロンプトに埋め込む類似事例の一覧を作る（各事例を整形してから一度に連結する）"""
+    return "".join(
+        f"""
 事例{i}:
 タイトル: {case['title']}
 炎上投稿: {case['incident_text']}
@@ -493,6 +577,13 @@ def generate_gemini_prompt_advanced(input_text: str, related_cases: List[Dict[st
 対応結果: {case.get('outcome', '不明')}
 ---
 """
+        for i, case in enumerate(related_cases, 1)
+    )
+
+def generate_gemini_prompt_advanced(input_text: str, related_cases: List[Dict[str, Any]], risk_score: RiskScore) -> str:
+    """Gemini API用のプロンプトを生成する（多要素スコアリング対応版）"""
+    
+    cases_text = _format_related_cases(related_cases)
     
     prompt = f"""
 あなたは企業の炎上リスク専門家です。以下の投稿案について、提供された類似事例と多要素スコアリング結果を参考にリスクを分析し、具体的な改善点を提案してください。
@@ -545,88 +636,6 @@ def generate_gemini_prompt_advanced(input_text: str, related_cases: List[Dict[st
     
     return prompt
 
-def generate_gemini_prompt(input_text: str, related_cases: List[Dict[str, Any]]) -> str:
-    """Gemini API用のプロンプトを生成する（改良版）"""
-    
-    cases_text = ""
-    for i, case in enumerate(related_cases, 1):
-        cases_text += f"""
-事例{i}:
-タイトル: {case['title']}
-炎上投稿: {case['incident_text']}
-炎上日: {case['incident_date']}
-原因カテゴリ: {case['cause_category']}
-炎上の理由: {case['reasoning_text']}
-企業: {case.get('company_info', '不明')}
-対応結果: {case.get('outcome', '不明')}
----
-"""
-    
-    prompt = f"""
-あなたは企業の炎上リスク専門家です。以下の投稿案について、提供された類似事例を参考にリスクを分析し、具体的な改善点を提案してください。
-
-【分析対象の投稿】
-{input_text}
-
-【参考となる類似事例】
-{cases_text}
-
-【分析ガイドライン】
-1. 類似事例の「炎上の理由」を参考に、投稿の潜在的なリスクを特定してください
-2. 原因カテゴリ（差別的表現、誹謗中傷、個人情報漏洩、労働問題、社会的責任の欠如、情報隠蔽、不適切な表現、不謹慎な表現、社会問題への偏見、趣味嗜好への差別）に基づいて分類してください
-3. 企業の社会的責任、ブランドイメージ、法的リスクを考慮してください
-4. 具体的で実用的な改善提案を提供してください
-
-【分析項目】
-1. リスクスコア（0-100の数値で評価）
-2. 原因カテゴリの特定
-3. 具体的なリスク要因の分析
-4. 類似事例との比較分析
-5. 社会的影響の予測
-6. 具体的な改善提案
-7. 推奨される表現の修正案
-
-【回答形式】
-リスクスコア: [0-100の数値]
-原因カテゴリ: [該当するカテゴリ]
-分析結果: [詳細な分析]
-リスク要因: [具体的なリスク要因]
-類似事例との比較: [比較分析]
-社会的影響: [予測される影響]
-改善提案: [具体的な改善点]
-修正案: [推奨される表現]
-"""
-    
-    return prompt
-
-def extract_risk_score_from_response(response: str) -> int:
-    """Geminiの回答からリスクスコアを抽出する"""
-    # リスクスコアを抽出する正規表現
-    score_match = re.search(r'リスクスコア[：:]\s*(\d+)', response)
-    if score_match:
-        return int(score_match.group(1))
-    
-    # 数値が見つからない場合は、キーワードベースで推定
-    high_risk_keywords = ['高', '危険', '炎上', '問題', '不適切', '差別', '誹謗']
-    medium_risk_keywords = ['中', '注意', '慎重', '配慮']
-    low_risk_keywords = ['低', '安全', '問題なし', '適切']
-    
-    response_lower = response.lower()
-    
-    for keyword in high_risk_keywords:
-        if keyword in response_lower:
-            return 80
-    
-    for keyword in medium_risk_keywords:
-        if keyword in response_lower:
-            return 50
-    
-    for keyword in low_risk_keywords:
-        if keyword in response_lower:
-            return 20
-    
-    return 50  # デフォルト値
-
 @app.get("/")
 async def root():
     """ルートエンドポイント"""
@@ -643,10 +652,8 @@ async def health_check():
     """ヘルスチェックエンドポイント"""
     try:
         conn = get_database_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM enjo_cases")
-        count = cursor.fetchone()[0]
-        conn.close()
+        with _db_lock:
+            count = conn.execute("SELECT COUNT(*) FROM enjo_cases").fetchone()[0]
         
         return {
             "status": "healthy",
@@ -659,6 +666,225 @@ async def health_check():
             "error": str(e)
         }
 
+def _text_hash(text: str) -> bytes:
+    """キャッシュのキーに使うテキストのハッシュ（SHA-256）を返す"""
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+class SemanticCache:
+    """埋め込みベクトルのコサイン類似度で引くLRUキャッシュ（スレッドから引けるようにロックで保護する）"""
+    
+    def __init__(self, maxsize: int, threshold: float):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._entries: "OrderedDict[Any, Tuple[List[float], Any, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, vector: List[float], group: Any) -> Optional[Any]:
+        """同じグループの中で最も類似した値を返す（類似度がしきい値未満なら None）"""
+        with self._lock:
+            best_key = None
+            best_similarity = self.threshold
+            for key, (stored_vector, stored_group, _) in self._entries.items():
+                if stored_group != group:
+                    continue
+                # ベクトルは正規化済みなので内積がコサイン類似度になる
+                similarity = sum(map(operator.mul, vector, stored_vector))
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key][2]
+    
+    def set(self, key: Any, vector: List[float], group: Any, value: Any):
+        """値を保存し、上限を超えた分は最も古く使われたものから捨てる"""
+        with self._lock:
+            self._entries[key] = (vector, group, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+class EmbeddingCache:
+    """テキストのSHA-256をキーにした埋め込みキャッシュ（メモリ上のLRUとSQLiteファイルの二段構成）"""
+    
+    def __init__(self, path: str, maxsize: int):
+        self.path = path
+        self.maxsize = maxsize
+        self._memory: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_available = True
+        self._lock = threading.Lock()
+    
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """保存先ファイルに接続する（書き込めない環境ではメモリのみで動かす）"""
+        if self._conn is None and self._disk_available:
+            try:
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    text_hash BLOB PRIMARY KEY,
+                    vector BLOB NOT NULL
+                )
+                """)
+                self._conn = conn
+            except sqlite3.Error:
+                self._disk_available = False
+        return self._conn
+    
+    def _remember(self, key: bytes, vector: List[float]):
+        """メモリ上に保存し、上限を超えた分は最も古く使われたものから捨てる"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+    
+    def get(self, key: bytes) -> Optional[List[float]]:
+        """保存済みの埋め込みを返す"""
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                return vector
+            
+            conn = self._connection()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute("SELECT vector FROM embeddings WHERE text_hash = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                return None
+            if row is None:
+                return None
+            
+            # ファイルには半精度（float16）で保存している
+            blob = row[0]
+            vector = list(struct.unpack(f'<{len(blob) // 2}e', blob))
+            self._remember(key, vector)
+            return vector
+    
+    def set(self, key: bytes, vector: List[float]):
+        """埋め込みを保存する"""
+        with self._lock:
+            self._remember(key, vector)
+            conn = self._connection()
+            if conn is None:
+                return
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO embeddings (text_hash, vector) VALUES (?, ?)",
+                        (key, struct.pack(f'<{len(vector)}e', *vector))
+                    )
+            except sqlite3.Error:
+                pass  # 保存できなくてもメモリ上のキャッシュは使える
+
+# 同じテキストの埋め込みはAPIを呼ばずに再利用する
+_embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_MEMORY_CACHE_SIZE)
+
+def _embed_text(text: str) -> Optional[List[float]]:
+    """Gemini APIでテキストの埋め込みを求め、長さ1に正規化して返す"""
+    cache_key = _text_hash(text)
+    vector = _embedding_cache.get(cache_key)
+    if vector is not None:
+        return vector
+    
+    try:
+        result = _genai.embed_content(model=EMBEDDING_MODEL, content=text)
+    except Exception:
+        return None  # 埋め込みが使えない場合は意味キャッシュを使わない
+    vector = result['embedding']
+    norm = math.sqrt(sum(x * x for x in vector))
+    if not norm:
+        return None
+    vector = [x / norm for x in vector]
+    _embedding_cache.set(cache_key, vector)
+    return vector
+
+# Gemini APIの呼び出し枠（イベントループ上で初めて使うときに作る）
+_gemini_semaphore: Optional[asyncio.Semaphore] = None
+
+async def _generate_analysis(prompt: str) -> str:
+    """Gemini APIで分析文を生成する（同時実行数を制限し、待ち時間中も他のリクエストを処理する）"""
+    global _gemini_semaphore
+    if _gemini_semaphore is None:
+        _gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+    async with _gemini_semaphore:
+        response = await _get_model().generate_content_async(prompt)
+    return response.text
+
+# 同じテキストの分析結果を一定時間再利用する（Gemini APIの呼び出しを省く）
+_response_cache = TTLCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+
+# 言い回しが少し違うだけの入力には、以前のGeminiの分析文を再利用する
+_semantic_cache = SemanticCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD)
+
+# 実行中の分析（同じテキストの同時リクエストは1回の分析を共有する）
+_inflight_analyses: Dict[bytes, "asyncio.Task[AnalyzeResponse]"] = {}
+
+async def _run_analysis(text: str, cache_key: bytes) -> AnalyzeResponse:
+    """分析を実行し、結果をキャッシュに保存する"""
+    # 1. 多要素スコアリングシステムで分析
+    risk_score = scoring_system.analyze_text(text)
+    
+    # 短い入力でリスクパターンもキーワードも検出されなければ、結果は低リスクに決まるため即座に返す
+    # （コンテンツリスクは一致がない場合の既定値10、法的・ブランド・社会的リスクは0になる）
+    if (len(text.strip()) < TRIVIAL_TEXT_LENGTH and risk_score.content_risk == 10
+            and not (risk_score.legal_risk or risk_score.brand_risk or risk_score.social_risk)):
+        result = AnalyzeResponse(
+            input_text=text,
+            risk_score=risk_score,
+            analysis_text=f"リスクとなる表現は検出されませんでした。\n\n多要素スコアリング結果:\n総合スコア: {risk_score.overall_score}/100\n信頼度: {risk_score.confidence}",
+            related_cases=[],
+            recommendations=scoring_system.get_recommendations(risk_score)
+        )
+        _response_cache.set(cache_key, result)
+        return result
+    
+    # 2. 関連事例を検索（データベースの読み取りはスレッドで行い、イベントループを止めない）
+    related_cases_data = await asyncio.to_thread(search_related_cases, text, 3)
+    
+    # 3. Gemini API用のプロンプトを生成（多要素スコア情報を含む）
+    prompt = generate_gemini_prompt_advanced(text, related_cases_data, risk_score)
+    
+    # 4. Gemini APIを呼び出し（意味的に近い入力の分析文があればそれを使う）
+    cacheable = True
+    # 初回はSDKの読み込みと初期化に時間がかかるため、スレッドで行ってイベントループを止めない
+    model = _get_model() if _model_initialized else await asyncio.to_thread(_get_model)
+    if model:
+        embedding = await asyncio.to_thread(_embed_text, text)
+        # 分析文はスコアとカテゴリに言及するため、同じカテゴリ・同じスコア帯の入力の分析文だけを再利用する
+        # （全件との内積の計算はスレッドで行い、イベントループを止めない）
+        semantic_group = (risk_score.category, risk_score.overall_score // SEMANTIC_CACHE_SCORE_BAND)
+        analysis_text = await asyncio.to_thread(_semantic_cache.get, embedding, semantic_group) if embedding else None
+        try:
+            if analysis_text is None:
+                analysis_text = await _generate_analysis(prompt)
+                if embedding:
+                    _semantic_cache.set(cache_key, embedding, semantic_group, analysis_text)
+        except Exception as e:
+            cacheable = False  # 一時的なエラーの結果は再利用しない
+            analysis_text = f"Gemini API呼び出しエラー: {str(e)}\n\n多要素スコアリング結果:\n総合スコア: {risk_score.overall_score}/100\n原因カテゴリ: {risk_score.category}"
+    else:
+        analysis_text = f"Gemini APIが設定されていません。\n\n多要素スコアリング結果:\n総合スコア: {risk_score.overall_score}/100\nコンテンツリスク: {risk_score.content_risk}/100\n法的リスク: {risk_score.legal_risk}/100\nブランドリスク: {risk_score.brand_risk}/100\n社会的リスク: {risk_score.social_risk}/100\n原因カテゴリ: {risk_score.category}\n信頼度: {risk_score.confidence}"
+    
+    # 5. 関連事例をモデルに変換
+    related_cases = [_construct_related_case(**case) for case in related_cases_data]
+    
+    # 6. 推奨事項を生成
+    recommendations = scoring_system.get_recommendations(risk_score)
+    
+    result = AnalyzeResponse(
+        input_text=text,
+        risk_score=risk_score,
+        analysis_text=analysis_text,
+        related_cases=related_cases,
+        recommendations=recommendations
+    )
+    if cacheable:
+        _response_cache.set(cache_key, result)
+    return result
+
 @app.post("/analyze", response_model=AnalyzeResponse)
 async def analyze_text(request: AnalyzeRequest):
     """
@@ -674,45 +900,29 @@ async def analyze_text(request: AnalyzeRequest):
     - **recommendations**: 推奨事項
     """
     try:
-        # 1. 多要素スコアリングシステムで分析
-        risk_score = scoring_system.analyze_text(request.text)
-        
-        # 2. 関連事例を検索
-        related_cases_data = search_related_cases(request.text, limit=3)
-        
-        # 3. Gemini API用のプロンプトを生成（多要素スコア情報を含む）
-        prompt = generate_gemini_prompt_advanced(request.text, related_cases_data, risk_score)
-        
-        # 4. Gemini APIを呼び出し
-        if model:
-            try:
-                response = model.generate_content(prompt)
-                analysis_text = response.text
-            except Exception as e:
-                analysis_text = f"Gemini API呼び出しエラー: {str(e)}\n\n多要素スコアリング結果:\n総合スコア: {risk_score.overall_score}/100\n原因カテゴリ: {risk_score.category}"
-        else:
-            analysis_text = f"Gemini APIが設定されていません。\n\n多要素スコアリング結果:\n総合スコア: {risk_score.overall_score}/100\nコンテンツリスク: {risk_score.content_risk}/100\n法的リスク: {risk_score.legal_risk}/100\nブランドリスク: {risk_score.brand_risk}/100\n社会的リスク: {risk_score.social_risk}/100\n原因カテゴリ: {risk_score.category}\n信頼度: {risk_score.confidence}"
-        
-        # 5. 関連事例をモデルに変換
-        related_cases = [RelatedCase(**case) for case in related_cases_data]
+        cache_key = _text_hash(request.text)
+        cached = _response_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
-        # 6. 推奨事項を生成
-        recommendations = scoring_system.get_recommendations(risk_score)
+        task = _inflight_analyses.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(_run_analysis(request.text, cache_key))
+            _inflight_analyses[cache_key] = task
+            task.add_done_callback(lambda _: _inflight_analyses.pop(cache_key, None))
         
-        return AnalyzeResponse(
-            input_text=request.text,
-            risk_score=risk_score,
-            analysis_text=analysis_text,
-            related_cases=related_cases,
-            recommendations=recommendations
-        )
+        # 接続が切れたリクエストがあっても、共有中の分析は止めない
+        return await asyncio.shield(task)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"分析中にエラーが発生しました: {str(e)}")
 
-# Vercel用のハンドラー
-from mangum import Mangum
-handler = Mangum(app)
+# Vercel用のハンドラー（mangumが未導入の環境ではアプリをそのまま使う）
+try:
+    from mangum import Mangum
+    handler = Mangum(app)
+except ImportError:
+    handler = app
 
 if __name__ == "__main__":
     import uvicorn
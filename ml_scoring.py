@@ -7,68 +7,88 @@
 
 import sqlite3
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.ensemble import HistGradientBoostingRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.pipeline import make_pipeline
 import joblib
 import os
 from typing import List, Dict, Tuple
 
+# ONNXへの変換と実行に使うライブラリ（未導入の環境ではjoblibで保存したモデルをそのまま使う）
+try:
+    from skl2onnx import to_onnx
+except ImportError:
+    to_onnx = None
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+# 原因カテゴリごとの学習用スコア
+CATEGORY_SCORES = {
+    '差別的表現': 95,
+    '誹謗中傷': 90,
+    '個人情報漏洩': 95,
+    '労働問題': 85,
+    '社会的責任の欠如': 80,
+    '情報隠蔽': 85,
+    '不適切な表現': 75,
+    '不謹慎な表現': 70,
+    '社会問題への偏見': 75,
+    '趣味嗜好への差別': 60
+}
+
+# 上記以外のカテゴリのスコア
+DEFAULT_CATEGORY_SCORE = 50
+
 class MLScoringSystem:
     """機械学習ベースのスコアリングシステム"""
     
     def __init__(self, db_path: str = "enjo_cases.db"):
         self.db_path = db_path
-        self.vectorizer = TfidfVectorizer(
-            max_features=1000,
-            stop_words=None,  # 日本語のストップワードは別途設定
-            ngram_range=(1, 2)  # 1-gramと2-gramを使用
+        # 語彙辞書を持たないハッシュ化でトークンを特徴量に変換し、IDFの重みだけ学習時に求める
+        self.vectorizer = make_pipeline(
+            HashingVectorizer(
+                n_features=2 ** 11,  # 学習・予測時に密行列へ変換するため、1行あたり8KB（float32）に抑える
+                ngram_range=(1, 2),  # 1-gramと2-gramを使用
+                alternate_sign=False,
+                norm=None,  # 正規化はTF-IDF変換後に行う
+                dtype=np.float32  # 密行列に変換したときのメモリをfloat64の半分に抑える
+            ),
+            TfidfTransformer()
         )
-        self.model = RandomForestRegressor(
-            n_estimators=100,
-            random_state=42,
-            max_depth=10
+        # 特徴量を255段階（uint8）のヒストグラムにまとめて学習・予測する勾配ブースティング
+        self.model = HistGradientBoostingRegressor(
+            max_iter=200,
+            max_bins=255,
+            learning_rate=0.05,
+            random_state=42
         )
+        # ONNX Runtimeで予測する場合の実行セッション（読み込んだモデルに対してのみ使う）
+        self._session = None
         self.is_trained = False
         
     def load_training_data(self) -> Tuple[List[str], List[int]]:
         """データベースから学習データを読み込み"""
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
         
-        # 炎上事例データを取得
-        cursor.execute("""
-            SELECT incident_text, cause_category, reasoning_text
+        # 炎上事例データを取得（本文と理由はSQL側で結合し、結果はカーソルから1行ずつ読む）
+        cursor = conn.execute("""
+            SELECT incident_text || ' ' || reasoning_text, cause_category
             FROM enjo_cases
         """)
         
         texts = []
         scores = []
         
-        for row in cursor.fetchall():
-            incident_text, cause_category, reasoning_text = row
-            
-            # テキストを結合
-            combined_text = f"{incident_text} {reasoning_text}"
+        for combined_text, cause_category in cursor:
             texts.append(combined_text)
             
             # カテゴリに基づいてスコアを設定
-            category_scores = {
-                '差別的表現': 95,
-                '誹謗中傷': 90,
-                '個人情報漏洩': 95,
-                '労働問題': 85,
-                '社会的責任の欠如': 80,
-                '情報隠蔽': 85,
-                '不適切な表現': 75,
-                '不謹慎な表現': 70,
-                '社会問題への偏見': 75,
-                '趣味嗜好への差別': 60
-            }
-            
-            score = category_scores.get(cause_category, 50)
-            scores.append(score)
+            scores.append(CATEGORY_SCORES.get(cause_category, DEFAULT_CATEGORY_SCORE))
         
         conn.close()
         return texts, scores
@@ -86,7 +106,8 @@ class MLScoringSystem:
         
         # テキストをベクトル化
         print("テキストをベクトル化中...")
-        X = self.vectorizer.fit_transform(texts)
+        # HistGradientBoostingRegressorは疎行列を受け付けないため密行列に変換する
+        X = self.vectorizer.fit_transform(texts).toarray()
         y = np.array(scores)
         
         # 学習データとテストデータに分割
@@ -107,6 +128,7 @@ class MLScoringSystem:
         print(f"平均二乗誤差: {mse:.2f}")
         print(f"決定係数 (R²): {r2:.2f}")
         
+        self._session = None
         self.is_trained = True
         
         # モデルを保存
@@ -116,24 +138,40 @@ class MLScoringSystem:
     
     def predict_risk_score(self, text: str) -> Dict:
         """テキストのリスクスコアを予測"""
+        results = self.predict_risk_score_batch([text])
+        return results[0] if results else None
+    
+    def predict_risk_score_batch(self, texts: List[str]) -> List[Dict]:
+        """複数テキストのリスクスコアをまとめて予測（ベクトル化と予測を1回で行う）"""
         if not self.is_trained:
             print("モデルが学習されていません。先にtrain_model()を実行してください。")
             return None
         
-        # テキストをベクトル化
-        X = self.vectorizer.transform([text])
+        if not texts:
+            return []
         
-        # スコアを予測
-        predicted_score = self.model.predict(X)[0]
+        # テキストをまとめてベクトル化
+        X = self.vectorizer.transform(texts).toarray()
         
-        # 信頼区間を計算（簡易版）
-        confidence = min(0.95, max(0.5, 1.0 - abs(predicted_score - 50) / 100))
+        # スコアをまとめて予測
+        if self._session is not None:
+            input_name = self._session.get_inputs()[0].name
+            predicted_scores = self._session.run(None, {input_name: X.astype(np.float32)})[0].ravel()
+        else:
+            predicted_scores = self.model.predict(X)
+        
+        results = []
+        for predicted_score in predicted_scores:
+            # 信頼区間を計算（簡易版）
+            confidence = min(0.95, max(0.5, 1.0 - abs(predicted_score - 50) / 100))
+            
+            results.append({
+                'predicted_score': int(predicted_score),
+                'confidence': round(confidence, 2),
+                'risk_level': self._get_risk_level(predicted_score)
+            })
         
-        return {
-            'predicted_score': int(predicted_score),
-            'confidence': round(confidence, 2),
-            'risk_level': self._get_risk_level(predicted_score)
-        }
+        return results
     
     def _get_risk_level(self, score: float) -> str:
         """スコアからリスクレベルを判定"""
@@ -156,6 +194,15 @@ class MLScoringSystem:
         
         joblib.dump(self.vectorizer, f"{model_dir}/vectorizer.pkl")
         joblib.dump(self.model, f"{model_dir}/model.pkl")
+        
+        # 予測用にONNX形式でも保存する（ハッシュ化とTF-IDF変換は変換器が対応しないため、モデル部分のみ）
+        onnx_path = f"{model_dir}/model.onnx"
+        if to_onnx is not None:
+            sample = np.zeros((1, self.model.n_features_in_), dtype=np.float32)
+            with open(onnx_path, "wb") as f:
+                f.write(to_onnx(self.model, sample).SerializeToString())
+        elif os.path.exists(onnx_path):
+            os.remove(onnx_path)  # 以前のモデルから変換したファイルを残さない
         print("モデルを保存しました")
     
     def load_model(self):
@@ -166,7 +213,15 @@ class MLScoringSystem:
         
         if os.path.exists(vectorizer_path) and os.path.exists(model_path):
             self.vectorizer = joblib.load(vectorizer_path)
+            # 予測にONNX Runtimeを使う場合も、再保存（save_model）できるようにsklearnのモデルは復元しておく
             self.model = joblib.load(model_path)
+            
+            # ONNX形式のモデルがあればONNX Runtimeで予測する
+            onnx_path = f"{model_dir}/model.onnx"
+            if onnxruntime is not None and os.path.exists(onnx_path):
+                self._session = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+            else:
+                self._session = None
             self.is_trained = True
             print("モデルを読み込みました")
             return True
@@ -175,12 +230,17 @@ class MLScoringSystem:
             return False
     
     def get_feature_importance(self) -> Dict[str, float]:
-        """特徴量の重要度を取得"""
+        """特徴量の重要度を取得（現在のHistGradientBoostingRegressorは重要度を持たないため、常に空の辞書を返す）"""
         if not self.is_trained:
             return {}
         
-        feature_names = self.vectorizer.get_feature_names_out()
-        importance = self.model.feature_importances_
+        # 勾配ブースティングのモデルは特徴量の重要度を持たない
+        importance = getattr(self.model, 'feature_importances_', None)
+        if importance is None:
+            return {}
+        
+        # ハッシュ化した特徴量は元の語に戻せないため、ハッシュの番号で表す
+        feature_names = [f"hash_{index}" for index in range(len(importance))]
         
         # 重要度の高い特徴量を取得
         feature_importance = dict(zip(feature_names, importance))
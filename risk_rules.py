@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+キーワードによるリスク判定ルール
+main.py と main_simple.py で共有するルール表とスコア計算
+"""
+
+from typing import Set, Tuple
+
+from advanced_scoring import KeywordMatcher
+
+# リスク判定ルール（上にあるものほど優先）: (キーワード, 加点, カテゴリ, 高リスクのルールか)
+RISK_RULES = (
+    (('殺害', '殺す', '死ね', '死ぬ', '殺人'), 40, "極めて危険な表現", True),
+    (('女性', '男性', '男', '女', '性別'), 30, "差別的表現", True),
+    (('差別', '偏見', '見下す'), 30, "差別的表現", True),
+    (('暴力', '暴行', '殴る', '蹴る'), 35, "暴力的表現", True),
+    (('クソ', 'くそ', '最悪', 'ひどい'), 25, "不適切な表現", True),
+    (('残業', '給料', '労働'), 20, "労働問題", False),
+    (('環境', '地球', '温暖化'), 15, "社会的責任", False),
+    (('税金', '政治', '政府'), 15, "社会問題", False),
+)
+
+# 一致がない場合のスコアとカテゴリ
+BASE_SCORE = 10
+DEFAULT_CATEGORY = "その他"
+
+# 区分ごとの判定（score_text_by_tier）で高リスク・中リスクのルールに一致したときの加点
+HIGH_RISK_BONUS = 30
+MEDIUM_RISK_BONUS = 15
+
+# キーワードからルールの優先度（RISK_RULES内の位置）を引く表と、全キーワードを1回の走査で検出するマッチャー
+_PRIORITY_BY_KEYWORD = {
+    keyword: priority
+    for priority, (keywords, _, _, _) in enumerate(RISK_RULES)
+    for keyword in keywords
+}
+_RISK_MATCHER = KeywordMatcher(_PRIORITY_BY_KEYWORD)
+
+# ルールごとの最終スコア（基本スコアへの加点と0-100への丸めは読み込み時に済ませておく）
+_RULE_SCORES = tuple(min(100, max(0, BASE_SCORE + score_delta)) for _, score_delta, _, _ in RISK_RULES)
+
+def _matched_priorities(text: str) -> Set[int]:
+    """テキストに一致したルールの優先度を返す"""
+    return {_PRIORITY_BY_KEYWORD[keyword] for keyword in _RISK_MATCHER.find(text)}
+
+def score_text(text: str) -> Tuple[int, str]:
+    """一致したうち最も優先度の高いルールで (スコア, カテゴリ) を決める"""
+    priorities = _matched_priorities(text)
+    if not priorities:
+        return BASE_SCORE, DEFAULT_CATEGORY
+    
+    priority = min(priorities)
+    return _RULE_SCORES[priority], RISK_RULES[priority][2]
+
+def score_text_by_tier(text: str) -> Tuple[int, str]:
+    """高リスク・中リスクの区分ごとに加点して (スコア, カテゴリ) を決める（カテゴリは中リスクのものを優先）"""
+    priorities = _matched_priorities(text)
+    score = BASE_SCORE
+    category = DEFAULT_CATEGORY
+    
+    high_risk = min((p for p in priorities if RISK_RULES[p][3]), default=None)
+    if high_risk is not None:
+        score += HIGH_RISK_BONUS
+        category = RISK_RULES[high_risk][2]
+    
+    medium_risk = min((p for p in priorities if not RISK_RULES[p][3]), default=None)
+    if medium_risk is not None:
+        score += MEDIUM_RISK_BONUS
+        category = RISK_RULES[medium_risk][2]
+    
+    return min(100, max(0, score)), category
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+有効期限付きのLRUキャッシュ
+各APIで分析結果を一定時間だけ再利用するために使う
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+class TTLCache:
+    """有効期限付きのLRUキャッシュ（イベントループ上からのみ使う）"""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+    
+    def get(self, key: Any) -> Optional[Any]:
+        """有効な値があれば返し、最近使ったものとして扱う"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+    
+    def set(self, key: Any, value: Any):
+        """値を保存し、上限を超えた分は最も古く使われたものから捨てる"""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)